@@ -3,13 +3,21 @@ Author : Harry Carstairs
 
 A script to remove the best fit plane to a 2D array of numbers
 
+The plane can be fitted to a random sample of pixels (pass N, optionally a seed),
+or exactly to every valid pixel (N=None). order=2 fits a quadratic surface instead.
+
 """
 
 
 import numpy as np
 from scipy.linalg import lstsq
 
-def get_samples(array,N):
+# Exponents of x and y for each coefficient of the surface, by order
+# (the order 1 coefficients are those used by plane)
+TERMS = {1: [(1,0),(0,1),(0,0)],
+         2: [(2,0),(1,1),(0,2),(1,0),(0,1),(0,0)]}
+
+def get_samples(array,N,seed=None,order=1):
     """
     Takes a selection of N samples from a 2D array
 
@@ -18,11 +26,16 @@ def get_samples(array,N):
     N : int
         number of samples to take
     array : (m x n) numpy array 
+    seed : int or numpy Generator, optional
+        makes the selection reproducible
+    order : int
+        1 for a plane, 2 for a quadratic surface
 
     Returns
     -------
     A : (N x 3) numpy array 
         Matrix with 3 columns: the first two contain X and Y values, the third contains 1s
+        (with order=2, one column for each of the terms in TERMS[2])
     B : (N x 1) numpy array
         Matrix of Z values
         
@@ -31,17 +44,28 @@ def get_samples(array,N):
     Where p is a (3 x 1) matrix
     N > 3 , i.e. the problem is over-specified
     so we are looking for least squares solution
+    NaN values are not used - further samples are drawn in their place,
+    up to 10 rounds of N draws, so N samples are returned unless the array is mostly NaN
     """
+    rng = np.random.default_rng(seed)
     X,Y = array.shape[0], array.shape[1]
-    x_vals = np.random.randint(0,X,N)
-    y_vals = np.random.randint(0,Y,N)
+    x_vals, y_vals = [], []
+    found = 0
+    for attempt in range(10):
+        x = rng.integers(0,X,N)
+        y = rng.integers(0,Y,N)
+        not_nan = ~np.isnan(array[x,y])
+        x_vals.append(x[not_nan])
+        y_vals.append(y[not_nan])
+        found += not_nan.sum()
+        if found >= N:
+            break
+    x_vals = np.concatenate(x_vals)[:N]
+    y_vals = np.concatenate(y_vals)[:N]
     B = array[x_vals,y_vals]
-    not_nan = ~np.isnan(B)
-    B = B[not_nan]
-    A = np.ones((N,3))
-    A[:,0] = x_vals
-    A[:,1] = y_vals
-    A = A[not_nan]
+    A = np.ones((B.size,len(TERMS[order])))
+    for k, (a,b) in enumerate(TERMS[order]):
+        A[:,k] = x_vals**a * y_vals**b
     return A, B
 
 def plane(p,x,y):
@@ -50,26 +74,98 @@ def plane(p,x,y):
     # But equivalent to the matrix version]
     return p[0]*x + p[1]*y + p[2]
 
-def get_coeff(array,N):
-    A,B = get_samples(array,N)
+def surface(p,x,y,order=1):
+    # Equation of the surface of the given order, x and y can be broadcast
+    result = 0
+    for k, (a,b) in enumerate(TERMS[order]):
+        result = result + p[k] * x**a * y**b
+    return result
+
+def normal_equations(array,offset=(0,0),order=1):
+    """
+    Normal equations of the best fit surface to every valid (non-NaN) value in array
+
+    Parameters
+    ----------
+    array : (m x n) numpy array
+    offset : (x, y) index of array[0,0] when array is one block of a larger array
+    order : int, 1 for a plane, 2 for a quadratic surface
+    
+    Returns
+    -------
+    AtA : (k x k) numpy array
+    AtB : (k,) numpy array
+    where k is the number of coefficients (3 for a plane)
+    
+    The least squares plane p solves AtA x p = AtB
+    Because the sums are over pixels, the equations of separate blocks
+    can be added together before solving, so a large array can be streamed
+    The sums are built from row and column index sums - no coordinate grids are made
+    """
+    terms = TERMS[order]
+    valid = ~np.isnan(array)
+    Z = np.where(valid,array,0)
+    x = np.arange(array.shape[0]) + offset[0]
+    y = np.arange(array.shape[1]) + offset[1]
+    Px = np.vander(x,2*order+1,increasing=True).astype(float) # columns x^0, x^1, ...
+    Py = np.vander(y,2*order+1,increasing=True).astype(float)
+    counts = Px.T @ (valid @ Py)   # counts[a,b] = sum of x^a y^b over valid pixels
+    sums = Px.T @ (Z @ Py)         # sums[a,b] = sum of x^a y^b z
+    AtA = np.array([[counts[a1+a2,b1+b2] for a2,b2 in terms] for a1,b1 in terms])
+    AtB = np.array([sums[a,b] for a,b in terms])
+    return AtA, AtB
+
+def solve_normal(AtA,AtB):
+    # Coefficients from (possibly accumulated) normal equations
+    # Scaling by the diagonal keeps the higher order terms well conditioned
+    d = np.sqrt(np.diag(AtA))
+    d[d == 0] = 1
+    return lstsq(AtA/np.outer(d,d),AtB/d)[0] / d
+
+def exact_coeff(array,order=1,block_rows=1024):
+    # Fits to every valid pixel, accumulating the normal equations a block of rows at a time
+    k = len(TERMS[order])
+    AtA, AtB = np.zeros((k,k)), np.zeros(k)
+    for x0 in range(0,array.shape[0],block_rows):
+        block_AtA, block_AtB = normal_equations(array[x0:x0+block_rows],offset=(x0,0),order=order)
+        AtA += block_AtA
+        AtB += block_AtB
+    return solve_normal(AtA,AtB)
+
+def get_coeff(array,N,seed=None,order=1):
+    # N=None fits to every valid pixel, otherwise to N random samples
+    if N is None:
+        return exact_coeff(array,order)
+    A,B = get_samples(array,N,seed,order)
     result = lstsq(A,B) # Scipy.optimise finds least squares solution 
     return result[0]    # First component is the array p itself
+
+def subtract_surface(array,p,order=1,block_rows=1024):
+    # Subtracts the surface from array in place, broadcasting x against y a block of rows at a time
+    y = np.arange(array.shape[1])
+    for x0 in range(0,array.shape[0],block_rows):
+        x = np.arange(x0,min(x0+block_rows,array.shape[0]))[:,np.newaxis]
+        array[x0:x0+block_rows] -= surface(p,x,y,order)
+    return array
     
-def remove_plane(array,N):
+def remove_plane(array,N=None,seed=None,order=1,inplace=False):
     """
 
     Parameters
     ----------
     array : 2D numpy array
     N : int, number of sample points to take
+        (None fits exactly to every valid pixel)
+    seed : int or numpy Generator, makes the sampling reproducible
+    order : int, 1 for a plane, 2 for a quadratic surface
+    inplace : bool, subtract from array itself rather than a copy (array must be float)
 
     Returns
     -------
     residual : array with best-fit plane subtracted - same shape as input
 
     """
-    coeff = get_coeff(array,N)
-    y,x = np.meshgrid(np.arange(array.shape[1]),np.arange(array.shape[0]))
-    best_fit = plane(coeff,x,y)
-    residual = array - best_fit
-    return residual
\ No newline at end of file
+    coeff = get_coeff(array,N,seed,order)
+    if not inplace:
+        array = np.array(array,dtype=float)
+    return subtract_surface(array,coeff,order)
@@ -0,0 +1,137 @@
+"""
+Author : Harry Carstairs
+
+Share of tropical forest that is hilly, for any slope threshold, from one pass over the slope raster
+
+The raster (e.g. HTF_slope90_merged.tif) has the 90th percentile slope of each 1 km cell in its first band
+and the fraction of the cell covered by forest in its second. The raster is read once, in strips of rows
+(in parallel with workers), into a histogram of slope weighted by forest fraction. Its cumulative sum
+gives the hilly forest for every threshold at once:
+
+    histogram = slope_histogram(R+'elevation/HTF_slope90_merged.tif', workers=4)
+    percent_hilly(histogram, [10,20,30,40])    # % of forest where slope90 >= H
+
+Regions (e.g. continents) given as shapes are rasterised strip by strip and get a histogram each,
+from the same pass:
+
+    histogram = slope_histogram(path, regions=continents, name='CONTINENT')
+
+Thresholds must be edges of the histogram (every 0.1 degree by default), where the result is exact.
+Cells with no slope count as not hilly, and cells with no forest fraction are left out (as xarray's sum).
+
+"""
+
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio import features, windows
+from concurrent.futures import ProcessPoolExecutor
+
+THRESHOLDS = [10,20,30,40]
+
+# Slope bins - thresholds are read off at these edges
+EDGES = np.round(np.arange(0,90.05,0.1),1)
+
+def strips(height,width,rows):
+    # Windows of whole rows covering a raster
+    return [windows.Window(0,y0,width,min(rows,height-y0)) for y0 in range(0,height,rows)]
+
+def strip_histogram(path,strip,edges,shapes=None,n_regions=0,slope_band=1,forest_band=2):
+    """
+    Forest-weighted slope histogram of one strip, as an (n_regions+1, len(edges)+1) array
+    Row 0 is the whole strip, row k the pixels of region k. Column 0 holds slopes below edges[0]
+    (and missing slopes), and column i slopes in [edges[i-1], edges[i]) - the last one is open ended
+    """
+    with rasterio.open(path) as src:
+        slope = src.read(slope_band,window=strip,masked=True).astype(np.float64).filled(np.nan)
+        forest = src.read(forest_band,window=strip,masked=True).astype(np.float64).filled(np.nan)
+        transform = src.window_transform(strip)
+    valid = np.isfinite(forest)
+    bins = np.searchsorted(edges,slope[valid],side='right')
+    bins[~np.isfinite(slope[valid])] = 0
+    weights = forest[valid]
+    n_bins = len(edges)+1
+    histogram = np.zeros((n_regions+1,n_bins))
+    histogram[0] = np.bincount(bins,weights=weights,minlength=n_bins)
+    if n_regions:
+        labels = features.rasterize(shapes,out_shape=slope.shape,transform=transform,
+                                    fill=0,dtype='int32')[valid]
+        inside = labels > 0
+        # One bincount for every region: bin i of region k becomes (k-1)*n_bins + i
+        counts = np.bincount((labels[inside]-1)*n_bins + bins[inside],weights=weights[inside],
+                             minlength=n_regions*n_bins)
+        histogram[1:] = counts.reshape(n_regions,n_bins)
+    return histogram
+
+def strips_histogram(path,batch,edges,shapes,n_regions,slope_band,forest_band):
+    # Sum of the histograms of a batch of strips (one task of a worker)
+    return sum(strip_histogram(path,s,edges,shapes,n_regions,slope_band,forest_band) for s in batch)
+
+def slope_histogram(path,edges=EDGES,regions=None,name='name',rows=256,workers=1,
+                    slope_band=1,forest_band=2):
+    """
+    Forest-weighted histogram of slope over a raster, in one pass
+
+    Parameters
+    ----------
+    path : str
+        raster with slope and forest fraction bands
+    edges : 1D array
+        slope bin edges (the thresholds that can be read off)
+    regions : GeoDataFrame, optional
+        shapes of regions to break the histogram down by (a pixel in overlapping regions goes to the last)
+    name : str
+        column of regions that names them; regions made of several shapes are merged
+    rows : int
+        rows of the raster read at a time
+    workers : int
+        processes reading strips in parallel
+
+    Returns
+    -------
+    histogram : dict
+        edges : slope bin edges
+        names : 'all', then the region names
+        weights : (len(names), len(edges)+1) forest fraction summed in each slope bin (see strip_histogram)
+    """
+    edges = np.asarray(edges,dtype=np.float64)
+    with rasterio.open(path) as src:
+        height, width, crs = src.height, src.width, src.crs
+    names, shapes = ['all'], None
+    if regions is not None:
+        if regions.crs is not None and crs is not None:
+            regions = regions.to_crs(crs)
+        region_names = list(pd.unique(regions[name]))
+        names += region_names
+        shapes = [(g,region_names.index(r)+1) for g, r in zip(regions.geometry,regions[name])]
+    n_regions = len(names)-1
+    tasks = strips(height,width,rows)
+    # Strips are dealt out so every worker gets a share
+    batches = [tasks[k::workers] for k in range(workers)]
+    args = (edges,shapes,n_regions,slope_band,forest_band)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            parts = list(executor.map(strips_histogram,[path]*workers,batches,*[[a]*workers for a in args]))
+    else:
+        parts = [strips_histogram(path,tasks,*args)]
+    return {'edges':edges,'names':names,'weights':sum(parts)}
+
+def percent_hilly(histogram,thresholds=THRESHOLDS):
+    """
+    Percentage of forest where the slope is at least each threshold (the notebook's percent_hilly(H))
+    Returns a DataFrame with a row for each of histogram['names'] and a column for each threshold
+    """
+    edges = histogram['edges']
+    weights = histogram['weights']
+    # hilly[:, i] is the forest with slope >= edges[i]
+    hilly = np.cumsum(weights[:,::-1],axis=1)[:,::-1][:,1:]
+    total = weights.sum(axis=1)
+    columns = []
+    for H in thresholds:
+        i = np.flatnonzero(np.isclose(edges,H))
+        if len(i) == 0:
+            raise ValueError('threshold '+str(H)+' is not an edge of the histogram')
+        with np.errstate(invalid='ignore',divide='ignore'):
+            columns.append(100*hilly[:,i[0]]/total)
+    return pd.DataFrame(np.stack(columns,axis=1),index=histogram['names'],columns=list(thresholds))
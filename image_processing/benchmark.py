@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Benchmarks of the numpy processing in make_DEMs.py (see height_core.py), on synthetic interferograms
+No SNAP or TanDEM-X data are needed.
+
+Each synthetic scene has a wrapped phase with a ramp, a hill and noise, NaN holes, a coherence raster,
+and slant range / incidence angle tie-point grids like those of a TDX CoSSC product.
+Scene sizes follow the number of range looks, from a full resolution (ML1) scene of ML1_SIZE pixels.
+Every stage is timed (best of --repeat runs) and its peak memory measured with tracemalloc:
+    $python benchmark.py --looks 3 8 16 32 --save benchmark_baseline.json
+    $python benchmark.py --looks 3 8 16 32 --compare benchmark_baseline.json
+With --compare, stages slower than the baseline by more than --tolerance are reported as regressions
+(and the script exits with status 1).
+benchmark_baseline.json holds the results of the first command above. Times depend on the machine,
+so save a baseline of your own before comparing on another one.
+"""
+
+import numpy as np
+import argparse
+import json
+import time
+import tracemalloc
+import height_core
+from deramp import remove_plane
+
+# (range, azimuth) pixels of a full resolution scene - the ML1 raster of a typical CoSSC interferogram
+ML1_SIZE = (9000,12000)
+
+# Tie points across each dimension (SNAP grids are ~11 x 11)
+GRID_POINTS = 11
+
+def scene_size(looks):
+    # (W, H) of the multilooked raster - Multilook keeps the pixels roughly square
+    return max(ML1_SIZE[0]//looks,16), max(ML1_SIZE[1]//looks,16)
+
+def tie_point_grids(W,H):
+    """
+    Synthetic slant_range_time (ns) and incident_angle (degrees) tie-point grids, as (layout, values)
+    (see height_core.grid_geometry)
+    Slant range grows across the swath from ~600 km, and the incidence angle from 30 to 45 degrees
+    """
+    subX, subY = W/(GRID_POINTS-1), H/(GRID_POINTS-1)
+    layout = ((GRID_POINTS,GRID_POINTS),0.5,0.5,subX,subY)
+    across = np.linspace(0,1,GRID_POINTS)[np.newaxis,:]
+    along = np.linspace(0,1,GRID_POINTS)[:,np.newaxis]
+    R = 600e3 + 40e3*across + 100*along
+    rangeT = 2*R/(3*10**8)*10**9
+    theta = 30 + 15*across + 0.1*along
+    return (layout,rangeT), (layout,theta)
+
+def synthetic_scene(looks,noise=0.5,ramp=3.0,nan_fraction=0.01,seed=0):
+    """
+    Synthetic filtered interferogram at a number of range looks
+
+    Parameters
+    ----------
+    looks : int
+        number of range looks - sets the size (see scene_size)
+    noise : float
+        standard deviation of the phase noise (radians)
+    ramp : float
+        phase change (radians) across the scene from the residual plane
+    nan_fraction : float
+        fraction of pixels that are NaN (in small holes, like masked water or layover)
+    seed : int
+        makes the scene reproducible
+
+    Returns
+    -------
+    scene : dict
+        phase : (W x H) wrapped phase, in the orientation of make_DEMs.get_data
+        coh : (W x H) coherence
+        range_grid, theta_grid : tie-point grids for height_core.grid_geometry
+    """
+    rng = np.random.default_rng(seed)
+    W, H = scene_size(looks)
+    x = np.linspace(-1,1,W)[:,np.newaxis]
+    y = np.linspace(-1,1,H)[np.newaxis,:]
+    hill = 2.0*np.exp(-(x**2 + y**2)/0.2)
+    phase = 0.5*ramp*(x + 0.5*y) + hill + noise*rng.standard_normal((W,H))
+    phase = np.angle(np.exp(1j*(phase + 1.0)))
+    coh = np.clip(0.7 - 0.2*hill/2 + 0.1*rng.standard_normal((W,H)),0,1)
+    # Holes of 4 x 4 pixels
+    n_holes = int(nan_fraction*W*H/16)
+    hx, hy = rng.integers(0,W-4,n_holes), rng.integers(0,H-4,n_holes)
+    for i in range(4):
+        for j in range(4):
+            phase[hx+i,hy+j] = np.nan
+            coh[hx+i,hy+j] = np.nan
+    range_grid, theta_grid = tie_point_grids(W,H)
+    return {'phase':phase,'coh':coh,'range_grid':range_grid,'theta_grid':theta_grid}
+
+def kz(scene,wavelength=0.031,baseline=120.0,HoA=-50.0):
+    # Wavenumber of every pixel, as make_DEMs.get_kz (x, y orientation)
+    W, H = scene['phase'].shape
+    geometry = height_core.grid_geometry(scene['range_grid'],scene['theta_grid'],W,0,H)
+    return height_core.kz_scale(wavelength,baseline,HoA) / geometry.transpose()
+
+def stages(scene):
+    """
+    The stages to benchmark, as {name: function of no arguments}
+    Each stage starts from the output of the one before, prepared here so only the stage is measured
+    """
+    phase = scene['phase']
+    recentered = height_core.zero_phase(phase)
+    unwrapped = height_core.unwrap(recentered)
+    offsets = np.linspace(-0.2,0.2,25) + np.pi
+    lo, hi, outside = height_core.neighbour_pairs(recentered,window=(offsets[0],offsets[-1]))
+    kz_array = kz(scene)
+    return {'zero_phase':lambda: height_core.zero_phase(phase),
+            'cost_fun':lambda: height_core.cost_fun(recentered,offsets[0]),
+            'jump_counts':lambda: height_core.jump_counts(lo,hi,offsets,outside=outside),
+            'unwrap':lambda: height_core.unwrap(recentered),
+            'remove_plane':lambda: remove_plane(unwrapped,10000,seed=0),
+            'remove_plane_exact':lambda: remove_plane(unwrapped),
+            'get_kz':lambda: kz(scene),
+            'phase_to_height':lambda: height_core.phase_to_height(phase,kz_array,seed=0)}
+
+def measure(function,repeat=3):
+    # (best time in seconds, peak memory in MB) of function
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak/2**20
+
+def run(looks_list,repeat=3,**scene_options):
+    # Benchmark results {'ML<looks>': {stage: {'seconds':..., 'peak_MB':...}}}
+    results = {}
+    for looks in looks_list:
+        scene = synthetic_scene(looks,**scene_options)
+        W, H = scene['phase'].shape
+        print('ML'+str(looks)+' ('+str(W)+' x '+str(H)+')')
+        results['ML'+str(looks)] = {}
+        for name, function in stages(scene).items():
+            seconds, peak = measure(function,repeat)
+            results['ML'+str(looks)][name] = {'seconds':seconds,'peak_MB':peak}
+            print('    {:<20}{:>10.4f} s{:>10.1f} MB'.format(name,seconds,peak))
+    return results
+
+def regressions(results,baseline,tolerance=1.25):
+    # Stages slower than in baseline by more than a factor of tolerance, as (size, stage, ratio)
+    slower = []
+    for size, stage_results in results.items():
+        for name, result in stage_results.items():
+            before = baseline.get(size,{}).get(name)
+            if before is None or before['seconds'] == 0:
+                continue
+            ratio = result['seconds']/before['seconds']
+            if ratio > tolerance:
+                slower.append((size,name,ratio))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the numpy processing chain on synthetic interferograms')
+    parser.add_argument('--looks',type=int,nargs='+',default=[3,8,16,32],help='number(s) of range looks')
+    parser.add_argument('--repeat',type=int,default=3,help='runs of each stage (the best is kept)')
+    parser.add_argument('--noise',type=float,default=0.5,help='phase noise (radians)')
+    parser.add_argument('--ramp',type=float,default=3.0,help='phase ramp across the scene (radians)')
+    parser.add_argument('--nan-fraction',type=float,default=0.01,help='fraction of NaN pixels')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--save',default=None,help='write the results to this JSON file')
+    parser.add_argument('--compare',default=None,help='JSON file of baseline results to compare with')
+    parser.add_argument('--tolerance',type=float,default=1.25,help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    results = run(args.looks,args.repeat,noise=args.noise,ramp=args.ramp,
+                  nan_fraction=args.nan_fraction,seed=args.seed)
+    if args.save is not None:
+        with open(args.save,'w') as file:
+            json.dump(results,file,indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        slower = regressions(results,baseline,args.tolerance)
+        for size, name, ratio in slower:
+            print('REGRESSION: '+size+' '+name+' is {:.2f}x slower than the baseline'.format(ratio))
+        if slower:
+            raise SystemExit(1)
+        print('No regressions against '+args.compare)
+
+if __name__ == '__main__':
+    main()
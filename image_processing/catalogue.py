@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+A small on-disk catalogue (SQLite) of the products made by the processing chain.
+
+Each product is recorded once, from its metadata, with its
+    country (site code GAB/PER), imaging mode, datetime, orbit direction,
+    number of range looks, height of ambiguity and baseline.
+The scripts further down the chain select their inputs by querying the catalogue,
+instead of re-globbing folders and splitting file names.
+
+The catalogue file is given by the TANDEX_CATALOGUE environment variable
+(default catalogue.sqlite in the current folder). To add or refresh the products in a folder:
+    $python catalogue.py <folder>
+Only files that are new or modified since they were catalogued are read again.
+"""
+
+import sqlite3
+import argparse
+import datetime as dt
+import os
+import re
+from get_metadata import metadata_root, element, attribute, footprint, intersects
+from sites import SITES, site_code
+
+CATALOGUE = os.environ.get('TANDEX_CATALOGUE','catalogue.sqlite')
+
+FIELDS = ['path','kind','country','mode','datetime','orbit','looks','hoa','baseline','mtime']
+
+# Fields that define a time series - products that differ only in datetime
+GROUP = ['country','mode','orbit','looks']
+
+def connect(database=CATALOGUE):
+    # Opens the catalogue, creating it if necessary
+    con = sqlite3.connect(database)
+    con.row_factory = sqlite3.Row
+    con.execute('''CREATE TABLE IF NOT EXISTS scenes (
+                       path TEXT PRIMARY KEY,
+                       kind TEXT,
+                       country TEXT,
+                       mode TEXT,
+                       datetime TEXT,
+                       orbit TEXT,
+                       looks INTEGER,
+                       hoa REAL,
+                       baseline REAL,
+                       mtime REAL)''')
+    con.execute('CREATE INDEX IF NOT EXISTS scenes_group ON scenes (kind, country, mode, orbit, looks)')
+    return con
+
+def name_datetime(file):
+    # The datetime token (YYYYMMDDTHHMMSS) of a product's file name, or None if it has none
+    match = re.search(r'_(\d{8}T\d{6})(_|\.)',os.path.basename(file))
+    return match.group(1) if match else None
+
+def describe(file):
+    """
+    Catalogue record for a BEAM-DIMAP product, read from its header
+    kind is 'height' for phase height products and 'ifg' for interferograms
+    The datetime is the one in the file name (the datatake time of the COSSC it was made from, see
+    make_ifgs.ifg_file), so all the products of a scene share it - the first line time of the header
+    can be seconds later. Only products without one in their name take the first line time.
+    """
+    root = metadata_root(file)
+    abstract = element(root,'Abstracted_Metadata')
+    acquisition = element(root,'CoSSC_Metadata','cossc_product','commonAcquisitionInfo')
+    geometry = element(acquisition,'acquisitionGeometry')
+    start = attribute(abstract,'first_line_time') # e.g. 01-JAN-2020 05:00:00.123456
+    # Site whose core plots the scene covers, or else the one in the file name
+    covered = [code for code in SITES if intersects(footprint(root),SITES[code]['core_plots'])]
+    return {'path':os.path.abspath(file),
+            'kind':'height' if 'height' in os.path.basename(file) else 'ifg',
+            'country':covered[0] if covered else site_code(os.path.basename(file)),
+            'mode':attribute(element(acquisition,'acquisitionMode'),'imagingMode'),
+            'datetime':name_datetime(file) or
+                        dt.datetime.strptime(start.split('.')[0],'%d-%b-%Y %H:%M:%S').strftime('%Y%m%dT%H%M%S'),
+            'orbit':attribute(geometry,'orbitDirection'),
+            'looks':int(float(attribute(abstract,'range_looks'))),
+            'hoa':float(attribute(geometry,'heightOfAmbiguity')),
+            'baseline':float(attribute(geometry,'effectiveBaseline')),
+            'mtime':os.path.getmtime(file)}
+
+def describe_name(file):
+    """
+    Catalogue record for a NetCDF file from its name alone
+    TDX_DEM_<country>_<mode>_<datetime>_<orbit>_ML<looks>.nc, as written by export_netcdf.py
+    Only used for files that were not catalogued when they were exported
+    Returns None for other NetCDF files (e.g. merged stacks)
+    """
+    meta = os.path.basename(file).split('.nc')[0].split('_')
+    if len(meta) != 7 or not meta[6].startswith('ML'):
+        return None
+    return {'path':os.path.abspath(file),
+            'kind':'netcdf',
+            'country':meta[2],
+            'mode':meta[3],
+            'datetime':meta[4],
+            'orbit':meta[5],
+            'looks':int(meta[6].split('ML')[1]),
+            'hoa':None,
+            'baseline':None,
+            'mtime':os.path.getmtime(file)}
+
+def register(con,record):
+    # Adds or replaces the record of one product
+    con.execute('INSERT OR REPLACE INTO scenes ('+','.join(FIELDS)+') VALUES ('
+                +','.join('?'*len(FIELDS))+')',[record[f] for f in FIELDS])
+    con.commit()
+
+def lookup(con,file):
+    # Record of one file, or None if it is not catalogued
+    row = con.execute('SELECT * FROM scenes WHERE path = ?',[os.path.abspath(file)]).fetchone()
+    return dict(row) if row is not None else None
+
+def update(con,folder='.'):
+    """
+    Brings the catalogue up to date with the products in folder
+    New or modified .dim files are read from their headers, and new .nc files from their names
+    Records of files that no longer exist in folder are removed
+    """
+    folder = os.path.abspath(folder)
+    known = {r['path']:r['mtime'] for r in query(con,folder=folder)}
+    present = set()
+    for entry in os.scandir(folder):
+        if not entry.name.startswith('TDX_') or not entry.name.endswith(('.dim','.nc')):
+            continue
+        present.add(entry.path)
+        if known.get(entry.path) == entry.stat().st_mtime:
+            continue
+        if entry.name.endswith('.dim'):
+            register(con,describe(entry.path))
+        elif entry.path not in known:
+            record = describe_name(entry.path)
+            if record is not None:
+                register(con,record)
+        else:
+            con.execute('UPDATE scenes SET mtime = ? WHERE path = ?',[entry.stat().st_mtime,entry.path])
+            con.commit()
+    for path in set(known) - present:
+        con.execute('DELETE FROM scenes WHERE path = ?',[path])
+    con.commit()
+
+def query(con,folder=None,**criteria):
+    """
+    Records matching criteria (e.g. kind='netcdf', country='GAB', looks=3), ordered by datetime
+    folder restricts the results to files in that folder
+    """
+    sql = 'SELECT * FROM scenes'
+    if criteria:
+        sql += ' WHERE ' + ' AND '.join(f+' = ?' for f in criteria)
+    records = [dict(r) for r in con.execute(sql+' ORDER BY datetime',list(criteria.values()))]
+    if folder is not None:
+        folder = os.path.abspath(folder)
+        records = [r for r in records if os.path.dirname(r['path']) == folder]
+    return records
+
+def groups(con,folder=None,**criteria):
+    # Distinct time series (dicts of the GROUP fields) among the records matching criteria
+    return [{f:r[f] for f in GROUP} for r in
+            {tuple(r[f] for f in GROUP):r for r in query(con,folder,**criteria)}.values()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Add the products in a folder to the catalogue')
+    parser.add_argument('folder',nargs='?',default='.')
+    parser.add_argument('--catalogue',default=CATALOGUE,help='catalogue file')
+    args = parser.parse_args()
+    con = connect(args.catalogue)
+    update(con,args.folder)
+    print(str(len(query(con,folder=args.folder)))+' products catalogued in '+args.folder)
+
+if __name__ == '__main__':
+    main()
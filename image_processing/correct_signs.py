@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Finds and corrects dates of a merged stack whose heights have the wrong sign.
+
+The first processing runs (ML4, 8, 16 and 32) did not take into account which satellite was primary,
+so some dates came out upside down (see negative_corrections.ipynb, where they were found by eye).
+Which dates is not recorded anywhere (get_kz already followed the sign of the height of ambiguity),
+so they are found from the heights themselves: the flipped dates are those whose signs have to change
+for every date to correlate positively with the others (from the correlation of every pair of dates,
+which also works when half of the dates are flipped).
+Dates that correlate with the others by less than --min-r are left as they are.
+The overall sign is that of most dates. When the dates split evenly, or none correlate well enough,
+nothing is changed unless a date known to be right is given with --reference.
+
+The stack is read in blocks of rows, and the correction is written back in place, one block at a time,
+so no corrected copy of the stack is made. Two variables (t) of the stack record what was done:
+    height_sign          0 - not checked yet (e.g. dates appended since the last check)
+                         1 - stored heights are consistent with the stack
+                        -1 - stored heights are flipped (with --view: found but not corrected on disk;
+                             read them through signed)
+    height_sign_applied -1 where the stored heights have been negated by this script, 1 elsewhere
+Corrections are undone with --undo (the dates are then unchecked again).
+
+$python correct_signs.py [merged files]
+"""
+
+import numpy as np
+import netCDF4
+import glob
+import os
+import argparse
+import catalogue
+from export_chunked import CHUNK
+
+SIGN = 'height_sign'
+APPLIED = 'height_sign_applied'
+
+# Dates whose mean correlation with the other dates is below this are left as they are
+MIN_R = 0.2
+
+def blocks(nc,block_rows=4*CHUNK):
+    # Slices of rows of the stack, whole numbers of chunks where it is chunked
+    H = len(nc.dimensions['lat'])
+    chunking = nc['height'].chunking()
+    if chunking != 'contiguous':
+        block_rows = max(block_rows//chunking[1],1)*chunking[1]
+    return [slice(y0,min(y0+block_rows,H)) for y0 in range(0,H,block_rows)]
+
+def read_block(nc,rows):
+    # (t, rows, lon) heights as float64, NaN where missing
+    return np.ma.filled(nc['height'][:,rows,:].astype(np.float64),np.nan)
+
+def stored(nc,name,default):
+    # A (t) variable of the stack, with default for dates appended after it was written (or if there is none)
+    T = len(nc.dimensions['t'])
+    if name not in nc.variables:
+        return np.full(T,default,dtype=np.int8)
+    values = np.ma.filled(nc[name][:],default).astype(np.int8)
+    return np.concatenate([values,np.full(T-len(values),default,dtype=np.int8)])
+
+def effective(signs):
+    # Factor that makes the stored heights consistent (unchecked dates are taken as they are)
+    return np.where(signs == -1,-1,1)
+
+def correlation_matrix(nc,factor,block_rows=4*CHUNK):
+    """
+    (t x t) correlation of every pair of dates, with the heights multiplied by factor
+    Each pair is correlated over the pixels where both are defined, from sums gathered block by block
+    """
+    T = len(nc.dimensions['t'])
+    n, sx, sxx, sxy = (np.zeros((T,T)) for i in range(4))
+    for rows in blocks(nc,block_rows):
+        height = (read_block(nc,rows)*factor[:,None,None]).reshape(T,-1)
+        valid = np.isfinite(height).astype(np.float64)
+        x = np.where(valid > 0,height,0)
+        # [i, j] sums over the pixels where both date i and date j are defined
+        n += valid @ valid.T
+        sx += x @ valid.T
+        sxx += (x*x) @ valid.T
+        sxy += x @ x.T
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean = sx/n
+        var = sxx/n - mean**2
+        return (sxy/n - mean*mean.T) / np.sqrt(var*var.T)
+
+def detect_correlation(nc,signs,block_rows=4*CHUNK,min_r=MIN_R,reference=None):
+    """
+    Signs of every date that make the dates of the stack agree with each other
+    They are the signs of the leading eigenvector of the correlation matrix, so they hold
+    however many dates are flipped. Dates whose mean correlation with the others (once aligned)
+    is below min_r keep the sign they had.
+    The overall sign is that of most of the other dates, or the one that keeps the date at position
+    reference (a date known to be right) as it is stored.
+    Raises ValueError if no date correlates well enough, or if the dates split evenly and no reference is given
+    Returns (signs, mean correlation of each date with the other dates once aligned)
+    """
+    factor = effective(signs)
+    C = correlation_matrix(nc,factor,block_rows)
+    defined = ~np.isnan(np.diag(C))
+    C = np.nan_to_num(C)
+    vector = np.linalg.eigh(C)[1][:,-1]
+    flip = np.where(vector < 0,-1,1)
+    aligned = C*flip[:,None]*flip[None,:]
+    np.fill_diagonal(aligned,0)
+    r = aligned.sum(axis=1)/max(defined.sum()-1,1)
+    r[~defined] = np.nan
+    with np.errstate(invalid='ignore'):
+        decided = defined & (r >= min_r)
+    if not decided.any():
+        raise ValueError('no date correlates with the others by '+str(min_r)+' or more - nothing to go on')
+    if reference is not None:
+        if not decided[reference]:
+            raise ValueError('the reference date does not correlate with the others by '+str(min_r)+' or more')
+        overall = flip[reference]
+    else:
+        kept = (flip[decided] == 1).sum() - (flip[decided] == -1).sum()
+        if kept == 0:
+            raise ValueError('half of the dates disagree with the other half - give a reference date')
+        overall = 1 if kept > 0 else -1
+    flip = flip*overall
+    return np.where(decided,factor*flip,signs).astype(np.int8), r
+
+def write_signs(nc,signs,applied):
+    if SIGN not in nc.variables:
+        var = nc.createVariable(SIGN,'i1',('t',),fill_value=np.int8(0))
+        var.long_name = 'sign of the stored height of each date (0: not checked)'
+    if APPLIED not in nc.variables:
+        var = nc.createVariable(APPLIED,'i1',('t',),fill_value=np.int8(0))
+        var.long_name = 'sign the stored height of each date has been multiplied by (-1: negated by correct_signs.py)'
+    nc[SIGN][:] = signs
+    nc[APPLIED][:] = applied
+
+def negate(nc,dates,block_rows=4*CHUNK):
+    # Negates the stored heights of dates, in place and one block of rows at a time
+    for rows in blocks(nc,block_rows):
+        for k in dates:
+            nc['height'][k,rows,:] = -nc['height'][k,rows,:]
+
+def apply_signs(nc,signs,applied,block_rows=4*CHUNK):
+    """
+    Negates the stored heights of the flipped dates
+    Their signs are then 1, and applied records that they have been negated
+    Returns (signs, applied)
+    """
+    flipped = np.flatnonzero(signs == -1)
+    negate(nc,flipped,block_rows)
+    signs, applied = signs.copy(), applied.copy()
+    signs[flipped] = 1
+    applied[flipped] = -applied[flipped]
+    return signs, applied
+
+def undo(path,block_rows=4*CHUNK):
+    # Puts back the stored heights of the dates negated by this script - they are then unchecked
+    with netCDF4.Dataset(path,'a') as nc:
+        signs, applied = stored(nc,SIGN,0), stored(nc,APPLIED,1)
+        negated = np.flatnonzero(applied == -1)
+        negate(nc,negated,block_rows)
+        signs[negated] = 0
+        applied[negated] = 1
+        write_signs(nc,signs,applied)
+    return negated
+
+def signed(ds):
+    """
+    Height of an xarray Dataset of a stack with the signs of height_sign applied
+    (for stacks corrected with --view; select the area and dates needed first, so only they are read)
+    """
+    if SIGN not in ds:
+        return ds.height
+    return ds.height*ds[SIGN].where(ds[SIGN] == -1,1)
+
+def stored_dates(nc):
+    # Dates of the stack as YYYY-MM-DD
+    t = nc['t']
+    return [time.strftime('%Y-%m-%d') for time in netCDF4.num2date(t[:],t.units,getattr(t,'calendar','standard'))]
+
+def date_position(nc,date):
+    # t position of a date given as YYYY-MM-DD
+    matches = [k for k, stored in enumerate(stored_dates(nc)) if stored == date]
+    if not matches:
+        raise ValueError('no date '+date+' in the stack')
+    return matches[0]
+
+def correct(path,view=False,block_rows=4*CHUNK,min_r=MIN_R,reference=None):
+    """
+    Finds the flipped dates of a merged stack and corrects them (or only records them, with view)
+    reference is a date (YYYY-MM-DD) known to have the right sign
+    Returns the t positions of the dates found to be flipped
+    """
+    with netCDF4.Dataset(path,'a') as nc:
+        signs, applied = stored(nc,SIGN,0), stored(nc,APPLIED,1)
+        dates = stored_dates(nc)
+        position = None if reference is None else date_position(nc,reference)
+        new, r = detect_correlation(nc,signs,block_rows,min_r,position)
+        print(path+': mean correlation with the other dates '+' '.join('%.2f' % c for c in r))
+        for k in np.flatnonzero(~(r >= min_r)):
+            print(path+': '+dates[k]+' correlates too weakly to be checked')
+        found = np.flatnonzero((new == -1) & (signs != -1))
+        for k in found:
+            print(path+': '+dates[k]+' is flipped')
+        if not view:
+            new, applied = apply_signs(nc,new,applied,block_rows)
+        write_signs(nc,new,applied)
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description='Find and correct sign-flipped dates of merged stacks')
+    parser.add_argument('files',nargs='*',help='merged stacks (default: the merged stacks in this folder)')
+    parser.add_argument('--min-r',type=float,default=MIN_R,
+                        help='dates correlating with the others by less than this are left as they are')
+    parser.add_argument('--reference',default=None,help='a date (YYYY-MM-DD) known to have the right sign')
+    parser.add_argument('--view',action='store_true',
+                        help='only record the signs in the stack, without rewriting the heights')
+    parser.add_argument('--undo',action='store_true',help='put back the heights negated by earlier runs')
+    parser.add_argument('--block-rows',type=int,default=4*CHUNK,help='rows of the stack read at a time')
+    args = parser.parse_args()
+    con = catalogue.connect()
+    files = args.files or glob.glob('*_merged.nc')
+    for f in files:
+        if args.undo:
+            print(f+': '+str(len(undo(f,args.block_rows)))+' dates put back')
+        else:
+            try:
+                correct(f,args.view,args.block_rows,args.min_r,args.reference)
+            except ValueError as e:
+                print(f+': not corrected - '+str(e))
+                continue
+        # Keeps the catalogue record of the stack current
+        record = catalogue.lookup(con,f)
+        if record is not None:
+            record['mtime'] = os.path.getmtime(f)
+            catalogue.register(con,record)
+
+if __name__ == '__main__':
+    main()
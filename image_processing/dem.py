@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Local DEMs for TopoPhaseRemoval and Terrain-Correction
+
+By default both operators use demName='SRTM 1Sec HGT', and SNAP finds (or downloads) and mosaics
+the SRTM tiles again for every scene and every operator. All our scenes cover the same two sites,
+so instead one DEM per site is mosaicked and cropped once from locally staged SRTM 1 arc-second tiles
+(N00E012.hgt, or zipped as downloaded by SNAP: N00E012.SRTMGL1.hgt.zip), and saved as a GeoTIFF.
+The operators then use it as an external DEM, so no tiles need to be found or downloaded.
+
+To build the DEM of a site, covering the footprints of its interferograms (with a margin):
+    $python dem.py GAB <srtm_tile_dir> TDX_IFG_GAB*.dim --dem-dir <dem_dir>
+or covering given bounds:
+    $python dem.py GAB <srtm_tile_dir> --bounds 11.9 -0.5 12.6 0.2 --dem-dir <dem_dir>
+The processing scripts use the DEMs in the directory given by --dem-dir (or TANDEX_DEM_DIR).
+Sites without a DEM there fall back to SNAP's SRTM 1Sec HGT.
+"""
+
+import os
+import glob
+import math
+import argparse
+from get_metadata import metadata_root, footprint
+
+SNAP_DEM = 'SRTM 1Sec HGT'
+
+# SRTM voids
+NO_DATA = -32768
+
+def dem_dir():
+    # Directory of the site DEMs, or None to always use SNAP's SRTM
+    return os.environ.get('TANDEX_DEM_DIR')
+
+def dem_file(site,folder=None):
+    folder = dem_dir() if folder is None else folder
+    return os.path.join(folder,site+'_SRTM1.tif')
+
+def dem_parameters(site):
+    """
+    DEM parameters for TopoPhaseRemoval and Terrain-Correction on a scene of site
+    The site's local DEM if there is one, otherwise SNAP's SRTM 1Sec HGT
+    SRTM heights are above the EGM96 geoid, so SNAP is asked to apply EGM as it does for its own SRTM
+    """
+    if site is None or dem_dir() is None or not os.path.exists(dem_file(site)):
+        return {'demName':SNAP_DEM}
+    return {'demName':'External DEM',
+            'externalDEMFile':dem_file(site),
+            'externalDEMNoDataValue':float(NO_DATA),
+            'externalDEMApplyEGM':True}
+
+def scene_bounds(files,margin=0.05):
+    # (west, south, east, north) covering the footprints of the BEAM-DIMAP products, plus margin degrees
+    corners = [corner for f in files for corner in footprint(metadata_root(f))]
+    lons = [lon for lon, lat in corners]
+    lats = [lat for lon, lat in corners]
+    return min(lons)-margin, min(lats)-margin, max(lons)+margin, max(lats)+margin
+
+def tile_name(lon,lat):
+    # SRTM tile with its south-west corner at integer (lon, lat), e.g. S01E012
+    return ('N' if lat >= 0 else 'S') + '%02d' % abs(lat) + ('E' if lon >= 0 else 'W') + '%03d' % abs(lon)
+
+def tile_paths(bounds,tile_dir):
+    """
+    Paths (readable by rasterio) of the SRTM tiles covering bounds
+    Raises FileNotFoundError naming any tiles that are not in tile_dir (open ocean tiles do not exist)
+    """
+    west, south, east, north = bounds
+    paths, missing = [], []
+    for lat in range(math.floor(south),math.ceil(north)):
+        for lon in range(math.floor(west),math.ceil(east)):
+            name = tile_name(lon,lat)
+            hgt = glob.glob(os.path.join(tile_dir,name+'*.hgt'))
+            zipped = glob.glob(os.path.join(tile_dir,name+'*.hgt.zip'))
+            if hgt:
+                paths.append(hgt[0])
+            elif zipped:
+                inner = os.path.basename(zipped[0])[:-len('.zip')]
+                paths.append('zip://'+os.path.abspath(zipped[0])+'!/'+inner)
+            else:
+                missing.append(name)
+    if missing:
+        raise FileNotFoundError('SRTM tiles not found in '+tile_dir+': '+', '.join(missing))
+    return paths
+
+def build_dem(site,bounds,tile_dir,folder=None):
+    """
+    Mosaics the SRTM tiles covering bounds and crops them to bounds
+    Saved as <site>_SRTM1.tif in folder (default: the DEM directory) - returns its path
+    """
+    import rasterio
+    from rasterio.merge import merge
+    target = dem_file(site,folder)
+    os.makedirs(os.path.dirname(os.path.abspath(target)),exist_ok=True)
+    sources = [rasterio.open(p) for p in tile_paths(bounds,tile_dir)]
+    try:
+        mosaic, transform = merge(sources,bounds=bounds,nodata=NO_DATA)
+        profile = sources[0].profile
+    finally:
+        for s in sources:
+            s.close()
+    profile.update(driver='GTiff',height=mosaic.shape[1],width=mosaic.shape[2],count=1,
+                   dtype='int16',nodata=NO_DATA,transform=transform,
+                   tiled=True,blockxsize=256,blockysize=256,compress='deflate')
+    # Written next to the target and moved over it, so the operators never read a partial DEM
+    temp = target + '.tmp'
+    with rasterio.open(temp,'w',**profile) as out:
+        out.write(mosaic.astype('int16'))
+    os.replace(temp,target)
+    return target
+
+# Command line use ---------------------------
+
+def add_argument(parser):
+    # Adds the --dem-dir option to a script's argument parser
+    parser.add_argument('--dem-dir',default=dem_dir(),
+                        help='directory of site DEMs made by dem.py (default: SNAP\'s SRTM 1Sec HGT)')
+
+def configure(folder):
+    # Makes the site DEMs in folder available to this process and the workers it starts
+    if folder is not None:
+        os.environ['TANDEX_DEM_DIR'] = os.path.abspath(folder)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the local DEM of a site from SRTM tiles')
+    parser.add_argument('site',help='site code, e.g. GAB')
+    parser.add_argument('tile_dir',help='directory of SRTM 1 arc-second tiles')
+    parser.add_argument('files',nargs='*',help='BEAM-DIMAP products whose footprints the DEM must cover')
+    parser.add_argument('--bounds',type=float,nargs=4,default=None,metavar=('WEST','SOUTH','EAST','NORTH'),
+                        help='bounds of the DEM (instead of the footprints of files)')
+    parser.add_argument('--margin',type=float,default=0.05,help='margin around the footprints in degrees')
+    add_argument(parser)
+    args = parser.parse_args()
+    if args.dem_dir is None:
+        parser.error('--dem-dir (or TANDEX_DEM_DIR) is needed')
+    if args.bounds is None and not args.files:
+        parser.error('give either products or --bounds')
+    bounds = args.bounds if args.bounds is not None else scene_bounds(args.files,args.margin)
+    print('Building '+args.site+' DEM over '+', '.join('%.3f' % b for b in bounds))
+    print('Saved '+build_dem(args.site,bounds,args.tile_dir,args.dem_dir))
+
+if __name__ == '__main__':
+    main()
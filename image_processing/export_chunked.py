@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Rewrites the NetCDF files made by export_netcdf.py as compressed, spatially chunked NetCDF4
+SNAP's NetCDF4-BEAM writer stores each band as one contiguous, uncompressed block,
+so taking a subset or cropping a plot reads the whole band.
+Here every (lat, lon) variable (height, coh, Phase, elevation...) is stored in square tiles
+of CHUNK x CHUNK pixels with zlib compression, so only the tiles a crop touches are read.
+
+Use the xarray_env, after export_netcdf.py, in the folder of the exported files:
+$python export_chunked.py [files] [--chunk 256]
+Files are rewritten in place (same names), so the scene catalogue and later steps are unchanged.
+Files that are already chunked are skipped.
+"""
+
+import xarray as xr
+import glob
+import os
+import argparse
+import catalogue
+
+# Tile size in pixels - a 1 ha plot spans a few tiles at most, even at ML3
+CHUNK = 256
+
+def chunk_sizes(lat,lon,chunk=CHUNK):
+    # One time step per chunk, and square spatial tiles
+    return (1,min(chunk,len(lat)),min(chunk,len(lon)))
+
+def spatial(var):
+    # Whether a variable is an image, i.e. its last two dimensions are lat, lon
+    return var.dims[-2:] == ('lat','lon')
+
+def encoding(ds,chunk=CHUNK):
+    # Chunked, compressed encoding of every image in ds
+    tiles = chunk_sizes(ds.lat,ds.lon,chunk)[1:]
+    return {name:{'zlib':True,
+                  'complevel':4,
+                  'shuffle':True,
+                  'chunksizes':(1,)*(var.ndim-2)+tiles}
+            for name, var in ds.data_vars.items() if spatial(var)}
+
+def is_chunked(ds,chunk=CHUNK):
+    # Whether every image in ds is already stored as it would be written here
+    return all(ds[name].encoding.get('zlib',False) and
+               tuple(ds[name].encoding.get('chunksizes') or ()) == e['chunksizes']
+               for name, e in encoding(ds,chunk).items())
+
+def reset_layout(ds):
+    # Forgets how the variables of ds are laid out on disk, so a new encoding can be given
+    for var in ds.variables.values():
+        for key in ['contiguous','chunksizes','zlib','complevel','shuffle']:
+            var.encoding.pop(key,None)
+
+def export_chunked(file,target=None,chunk=CHUNK):
+    """
+    Writes file to target (by default, over file) as chunked, compressed NetCDF4
+    Returns False if file was already chunked and nothing was written
+    """
+    target = file if target is None else target
+    with xr.open_dataset(file) as ds:
+        if target == file and is_chunked(ds,chunk):
+            return False
+        reset_layout(ds)
+        # Written next to the target and moved over it, so a failed write leaves the original
+        temp = target + '.tmp'
+        ds.to_netcdf(temp,format='NETCDF4',encoding=encoding(ds,chunk))
+    os.replace(temp,target)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Rewrite exported NetCDF files as chunked, compressed NetCDF4')
+    parser.add_argument('files',nargs='*',help='NetCDF files (default: TDX_DEM_*.nc in this folder)')
+    parser.add_argument('--chunk',type=int,default=CHUNK,help='tile size in pixels')
+    args = parser.parse_args()
+    files = args.files or [f for f in glob.glob('TDX_DEM_*.nc') if not f.endswith('_merged.nc')]
+    con = catalogue.connect()
+    for f in files:
+        if export_chunked(f,chunk=args.chunk):
+            print('chunked '+f)
+            # Keeps the catalogue record of the file current
+            record = catalogue.lookup(con,f)
+            if record is not None:
+                record['mtime'] = os.path.getmtime(f)
+                catalogue.register(con,record)
+        else:
+            print(f+' is already chunked')
+
+if __name__ == '__main__':
+    main()
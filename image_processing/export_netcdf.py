@@ -7,36 +7,36 @@ BEAM-DIMAP is the best form for SNAP, whereas NetCDF is easy to work on in Pytho
 To use this script, call it with a command line argument that points to the BEAM-DIMAP image
 $python export_netcdf.py <image_to_export>
 
+The files are written as SNAP lays them out (contiguous, uncompressed);
+run export_chunked.py afterwards (xarray_env) to chunk and compress them.
+
+Each exported file is added to the scene catalogue (see catalogue.py),
+with the metadata of the product it was made from.
+
 @author: Harry Carstairs
 """
 
 import sys
+import os
 from snappy import ProductIO as io
 import glob
+import catalogue
 
 files = glob.glob('TDX_IFG*height_TC*.dim')
+con = catalogue.connect()
 
 for f in files:
-    meta = f.split('_')
-    country = meta[2]
-    mode = meta[3]
-    datetime = meta[4]
-    ML = meta[7]
+    record = catalogue.describe(f)
     image = io.readProduct(f)
-    orbit = str(image.getMetadataRoot()
-                .getElement('CoSSC_Metadata')
-                .getElement('cossc_product')
-                .getElement('commonAcquisitionInfo')
-                .getElement('acquisitionGeometry')
-                .getAttribute('orbitDirection')
-                .getData())
     
     target = '_'.join(['TDX',
                        'DEM',
-                       country,
-                       mode,
-                       datetime,
-                       orbit,
-                       'ML'+ML+'.nc'])
+                       record['country'],
+                       record['mode'],
+                       record['datetime'],
+                       record['orbit'],
+                       'ML'+str(record['looks'])+'.nc'])
     
-    io.writeProduct(image,target,'NetCDF4-BEAM')
\ No newline at end of file
+    io.writeProduct(image,target,'NetCDF4-BEAM')
+    record.update(path=os.path.abspath(target),kind='netcdf',mtime=os.path.getmtime(target))
+    catalogue.register(con,record)
@@ -4,24 +4,27 @@ Created on Tue Mar 30 13:25:34 2021
 
 @author: Harry Carstairs
 
-This script uses Snappy to extract the metadata from TDX interferograms
+This script extracts the metadata from TDX interferograms into metadata.csv
 
 Takes one command line argument - the directory containing the interferograms
+Optionally, -j sets the number of files read at once
 
 Assumes GAB or PER in file names to indicate location
 
+The BEAM-DIMAP (.dim) headers are parsed directly as XML, so no products are loaded.
+Coverage of the core plots is tested against the scene footprint given by its corner coordinates.
+If metadata.csv already exists, only new or modified files are read again.
+
 """
 
-from snappy import ProductIO, HashMap, GPF
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import glob
-import sys
 import os
 import pandas as pd
 import math
-
-IFG_DIR = sys.argv[1]
-os.chdir(IFG_DIR)
-ifgs = glob.glob('*.dim')
+from sites import SITES, site_code
 
 attributes = ['file',
             'country',
@@ -40,51 +43,127 @@ attributes = ['file',
             #'range_pixel',
             #'azimuth_pixel']
 
-def check_coverage(file,p):
+# Reading DIMAP headers ----------------------------------------------
+
+def metadata_root(file):
+    # The metadata tree of a BEAM-DIMAP product, as an XML element
+    root = ET.parse(file).getroot()
+    for elem in root.find('Dataset_Sources'):
+        if elem.get('name') == 'metadata':
+            return elem
+    raise ValueError('No metadata in '+file)
+
+def element(elem,*names):
+    # Descends through nested metadata elements - names are case insensitive, as in SNAP
+    for name in names:
+        matches = [e for e in elem.findall('MDElem') if e.get('name').lower() == name.lower()]
+        if not matches:
+            raise KeyError(name)
+        elem = matches[0]
+    return elem
+
+def attribute(elem,name):
+    # Value of a metadata attribute, as a string
+    for a in elem.findall('MDATTR'):
+        if a.get('name').lower() == name.lower():
+            return (a.text or '').strip()
+    raise KeyError(name)
+
+def footprint(root):
+    # Scene footprint as a closed (lon, lat) polygon, from the corner coordinates
+    abstract = element(root,'Abstracted_Metadata')
+    corners = ['first_near','first_far','last_far','last_near','first_near']
+    return [(float(attribute(abstract,c+'_long')),float(attribute(abstract,c+'_lat'))) for c in corners]
+
+# Coverage --------------------------------------------------------
+
+def inside(point,polygon):
+    # Ray casting test for a point inside a closed polygon
+    x, y = point
+    result = False
+    for (x1,y1), (x2,y2) in zip(polygon[:-1],polygon[1:]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            result = not result
+    return result
+
+def crosses(a1,a2,b1,b2):
+    # Whether the line segments a1-a2 and b1-b2 cross
+    def side(p,q,r):
+        return (q[0]-p[0])*(r[1]-p[1]) - (q[1]-p[1])*(r[0]-p[0])
+    return (side(a1,a2,b1)*side(a1,a2,b2) < 0) and (side(b1,b2,a1)*side(b1,b2,a2) < 0)
+
+def intersects(A,B):
+    # Whether two closed polygons overlap
+    if any(inside(p,B) for p in A[:-1]) or any(inside(p,A) for p in B[:-1]):
+        return True
+    return any(crosses(a1,a2,b1,b2) for a1,a2 in zip(A[:-1],A[1:]) for b1,b2 in zip(B[:-1],B[1:]))
+
+def check_coverage(file,root):
     ## Does the image definitely cover our study areas in Peru / Gabon
-    if 'GAB' in file:
-        region = 'POLYGON((12.24885799008746368 -0.14350824099999146, 12.24885110630293283 -0.14259615803456555, 12.24975595848531107 -0.14259626696242139, 12.24975584715663501 -0.14353065658873754, 12.24885799008746368 -0.14350824099999146))'
-    elif 'PER' in file:
-        region = 'POLYGON((-69.72334001018973026 -11.0329910794429793, -69.72334358246895647 -11.03207312025939579, -69.72240573287906784 -11.0320753572009469, -69.7224080470953993 -11.03302282454907512, -69.72334001018973026 -11.0329910794429793))'
-    params = HashMap()
-    params.put('geoRegion',region)
-    
-    fail = 'Empty' in GPF.createProduct('Subset',params,p).getName()
-    return not fail
-
-df = pd.DataFrame( columns = attributes )    
-
-for file in ifgs:
-    p = ProductIO.readProduct(file)
+    code = site_code(file)
+    if code is None:
+        return False
+    return intersects(footprint(root),SITES[code]['core_plots'])
+
+# -----------------------------------------------------------------
+
+def read_header(file):
+    # Metadata of one interferogram, as a dict with the keys in attributes
+    p = metadata_root(file)
     MD = dict()
     MD['file'] = file
-    if 'GAB' in file:
-        MD['country'] = 'Gabon'
-    elif 'PER' in file:
-        MD['country'] = 'Peru'
+    code = site_code(file)
+    if code is not None:
+        MD['country'] = SITES[code]['country']
     else:
         print('Country not identified')
-    cossc = p.getMetadataRoot().getElement('CoSSC_Metadata').getElement('cossc_product')
-    datetime = str(cossc.getElement('CommonAcquisitionInfo').getElement('acquisitionMode').getAttribute('datatakeStartTime').getData())
+    cossc = element(p,'CoSSC_Metadata','cossc_product')
+    acquisition = element(cossc,'commonAcquisitionInfo')
+    datetime = attribute(element(acquisition,'acquisitionMode'),'datatakeStartTime')
     MD['date'] = datetime.split('T')[0]
     MD['time'] = datetime.split('T')[1]
-    MD['imaging_mode'] = str(cossc.getElement('commonAcquisitionInfo').getElement('acquisitionMode').getAttribute('imagingMode').getData())
+    MD['imaging_mode'] = attribute(element(acquisition,'acquisitionMode'),'imagingMode')
     MD['covers_core_plots'] = str(check_coverage(file,p))
-    MD['baseline'] = float(str(cossc.getElement('commonAcquisitionInfo').getElement('acquisitionGeometry').getAttribute('effectiveBaseline').getData()))
-    MD['orbit_direction'] = str(cossc.getElement('commonAcquisitionInfo').getElement('acquisitionGeometry').getAttribute('orbitDirection').getData())
-    HoA = float(str(cossc.getElement('commonAcquisitionInfo').getElement('acquisitionGeometry').getAttribute('heightOfAmbiguity').getData()))
+    MD['baseline'] = float(attribute(element(acquisition,'acquisitionGeometry'),'effectiveBaseline'))
+    MD['orbit_direction'] = attribute(element(acquisition,'acquisitionGeometry'),'orbitDirection')
+    HoA = float(attribute(element(acquisition,'acquisitionGeometry'),'heightOfAmbiguity'))
     k = 2 * math.pi / HoA
     MD['height_of_ambiguity'] = HoA
     MD['vertical_wavenumber'] = k
-    MD['incidence_angle'] = float(str(cossc.getElement('commonSceneInfo').getElement('sceneCenterCoord').getAttribute('incidenceAngle').getData()))
-    MD['bandwidth'] = str(cossc.getElement('CommonAcquisitionInfo').getElement('acquisitionMode').getElement('rangeBandwidthClass').getAttribute('rgBW').getData())
-    df = df.append(pd.Series(MD),ignore_index=True)
-
-df.to_csv('metadata.csv')
-# Done!
-
-
-
-    
-    
-
+    MD['incidence_angle'] = float(attribute(element(cossc,'commonSceneInfo','sceneCenterCoord'),'incidenceAngle'))
+    MD['bandwidth'] = attribute(element(acquisition,'acquisitionMode','rangeBandwidthClass'),'rgBW')
+    return MD
+
+def build_table(ifgs,previous=None,workers=8):
+    """
+    Metadata table for the files in ifgs
+    previous is an earlier table (with an mtime column) - rows for files that
+    have not been modified since are reused rather than read again
+    """
+    rows = {}
+    if previous is not None and 'mtime' in previous:
+        for row in previous.to_dict('records'):
+            if row['file'] in ifgs and row['mtime'] == os.path.getmtime(row['file']):
+                rows[row['file']] = row
+    todo = [f for f in ifgs if f not in rows]
+    print('Reading '+str(len(todo))+' of '+str(len(ifgs))+' headers')
+    with ThreadPoolExecutor(workers) as pool:
+        for MD in pool.map(read_header,todo):
+            MD['mtime'] = os.path.getmtime(MD['file'])
+            rows[MD['file']] = MD
+    return pd.DataFrame([rows[f] for f in sorted(rows)],columns=attributes+['mtime'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract TDX interferogram metadata to metadata.csv')
+    parser.add_argument('IFG_DIR',help='directory containing the interferograms')
+    parser.add_argument('-j','--workers',type=int,default=8,help='number of files read at once')
+    args = parser.parse_args()
+    os.chdir(args.IFG_DIR)
+    ifgs = glob.glob('*.dim')
+    previous = pd.read_csv('metadata.csv',index_col=0) if os.path.exists('metadata.csv') else None
+    df = build_table(ifgs,previous,args.workers)
+    df.to_csv('metadata.csv')
+    # Done!
+
+if __name__ == '__main__':
+    main()
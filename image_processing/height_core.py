@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+The numpy part of make_DEMs.py: phase centring, quasi unwrapping, deramping and phase-to-height
+None of it needs snappy, so it can be run (and timed - see benchmark.py) without SNAP.
+Arrays are in the orientation of make_DEMs.get_data (x, y), except where noted.
+"""
+
+import numpy as np
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from deramp import remove_plane
+
+def zero_phase(wrapped_phase):
+    # Return phase values centered roughly on zero
+    # NaNs (no data) are left out of the histogram, as in make_DEMs.tiled_statistics
+    vals,binedges=np.histogram(wrapped_phase[~np.isnan(wrapped_phase)],bins=50)
+    binsize = binedges[1] - binedges[0]
+    peak = binedges[vals.argmax()] + 0.5*binsize
+    recentered = wrapped_phase - peak
+    return recentered
+
+def cost_fun(recentered,offset):
+    # Calculates how many 'jumps' remain after "quasi-unwrapping"
+    # The quasi unwrapping simply assumes all values are within a 
+    # 2pi interval and determines the offset required to center them
+    if offset < 0:
+        a = recentered + (recentered < offset)*2*np.pi
+    else:
+        a = recentered - (recentered > offset)*2*np.pi
+    cost1 = (np.abs(a[:-1] - a[1:]) > 5).sum()
+    cost2 = (np.abs(a[:,:-1] - a[:,1:]) > 5).sum()
+    return cost1+cost2
+
+def neighbour_pairs(phase,axes=(0,1),window=None,threshold=5):
+    """
+    (min, max) of the pairs of neighbouring pixels along the given axes, as float32
+    Pairs containing a NaN never count as a jump in cost_fun, so they are dropped.
+    With window = (lowest, highest offset), pairs that no offset in it can fall between are
+    dropped too, as their cost is the same for every offset: they are only counted.
+    Returns (lo, hi, outside), outside being the number of jumps among the pairs left out of the window
+    """
+    los, his = [], []
+    outside = 0
+    for axis in axes:
+        # One axis at a time, so only the pairs of one axis are held at once
+        first, second = (phase[:-1], phase[1:]) if axis == 0 else (phase[:,:-1], phase[:,1:])
+        lo = np.minimum(first,second,dtype=np.float32).ravel()
+        hi = np.maximum(first,second,dtype=np.float32).ravel()
+        if window is None:
+            keep = ~np.isnan(lo)
+        else:
+            keep = (hi >= window[0]) & (lo <= window[1])
+            outside += ((hi - lo)[~keep] > threshold).sum()
+        los.append(lo[keep])
+        his.append(hi[keep])
+    return np.concatenate(los), np.concatenate(his), int(outside)
+
+def jump_counts(lo, hi, offsets, threshold=5, outside=0):
+    """
+    Equivalent to [cost_fun(phase,offset) for offset in offsets], in one pass
+    lo, hi, outside are the neighbour pairs of the phase array (see neighbour_pairs),
+    with a window holding the offsets
+
+    A pair only changes when the offset falls between its two values: its difference
+    then becomes |2pi - (hi - lo)|. So the cost of every offset is the number of jumps
+    with no offset, plus a cumulative count of the pairs each offset straddles.
+    """
+    offsets = np.asarray(offsets,dtype=float)
+    order = np.argsort(offsets)
+    grid = offsets[order]
+    diff = hi - lo
+    before = diff > threshold
+    delta = (np.abs(2*np.pi - diff) > threshold).astype(int) - before
+    changed = delta != 0
+    lo, hi, delta = lo[changed], hi[changed], delta[changed]
+    
+    def straddled(side):
+        # Sum of delta over pairs with lo below each offset, minus those with hi below it
+        # side='left' counts values <= offset, side='right' counts values < offset
+        n = grid.size + 1
+        at_lo = np.bincount(np.searchsorted(grid,lo,side),weights=delta,minlength=n)
+        at_hi = np.bincount(np.searchsorted(grid,hi,side),weights=delta,minlength=n)
+        return np.cumsum(at_lo - at_hi)[:-1]
+    
+    # Positive offsets shift values above the offset, negative ones values below it
+    costs = outside + before.sum() + np.where(grid < 0, straddled('right'), straddled('left'))
+    result = np.empty(grid.size,dtype=int)
+    result[order] = np.rint(costs)
+    return result
+
+def unwrap(zeroed_phase,n_offsets=25,search_width=0.2):
+    # Quasi unwrapping, where we assume all values lie already within one 2pi interval
+    # n_offsets trial offsets are searched within search_width of the initial guess
+    vals,binedges=np.histogram(zeroed_phase[~np.isnan(zeroed_phase)],bins=50)
+    binsize = binedges[1] - binedges[0]
+    initial_guess = binedges[vals.argmin()] + 0.5*binsize
+    tryout = np.linspace(initial_guess-search_width,initial_guess+search_width,n_offsets)
+    lo, hi, outside = neighbour_pairs(zeroed_phase,window=(tryout[0],tryout[-1]))
+    costs = jump_counts(lo,hi,tryout,outside=outside)
+    fit = np.polyfit(tryout,costs,2)
+    offset = -fit[1]/(2*fit[0])
+    return unwrap_with_offset(zeroed_phase,offset)
+
+def unwrap_with_offset(zeroed_phase,offset):
+    # Moves the values beyond offset by 2pi
+    if offset < 0:
+        unwrapped = zeroed_phase + (zeroed_phase < offset)*2*np.pi
+    else:
+        unwrapped = zeroed_phase - (zeroed_phase > offset)*2*np.pi
+    return unwrapped
+
+def kz_scale(wavelength,baseline,HoA):
+    # kz = kz_scale / (R sin(theta)), with the sign of the height of ambiguity
+    scale = 4*np.pi*baseline / wavelength
+    if HoA < 0:
+        scale = -scale
+    return scale
+
+def tie_point_weights(n,offset,subsampling,grid_n):
+    # (n x grid_n) matrix of SNAP's linear tie-point interpolation along one axis
+    # Pixel centres outside the grid are extrapolated from the outermost tie points
+    f = (np.arange(n) + 0.5 - offset) / subsampling
+    i0 = np.clip(np.floor(f).astype(int),0,grid_n-2)
+    w = f - i0
+    weights = np.zeros((n,grid_n))
+    weights[np.arange(n),i0] = 1 - w
+    weights[np.arange(n),i0+1] = w
+    return weights
+
+
+def grid_geometry(range_grid,theta_grid,W,y0,h):
+    """
+    R sin(theta) for rows y0 to y0+h of a W pixel wide raster, in SNAP (row-major) orientation
+    range_grid and theta_grid are (layout, values) of the slant_range_time (ns) and incident_angle (degrees)
+    tie-point grids, where layout is ((rows, columns), offsetX, offsetY, subsamplingX, subsamplingY)
+    These are evaluated on the coarse tie-point grid and then interpolated to the pixel grid.
+    The interpolation is separable - two small matrix products instead of a dense read and trig pass
+    """
+    c = 3*10**8
+    layout, rangeT = range_grid
+    theta_layout, theta = theta_grid
+    R = 0.5 * c * rangeT*10**-9
+    sin_theta = np.sin(np.deg2rad(theta))
+    if layout == theta_layout:
+        coarse = [(layout,R*sin_theta)]
+    else:
+        coarse = [(layout,R),(theta_layout,sin_theta)]
+    geometry = 1
+    for (shape, offsetX, offsetY, subX, subY), values in coarse:
+        Wy = tie_point_weights(y0+h,offsetY,subY,shape[0])[y0:]
+        Wx = tie_point_weights(W,offsetX,subX,shape[1])
+        geometry = geometry * (Wy @ values @ Wx.T)
+    return geometry
+
+def phase_to_height(phase,kz,N=10000,seed=None):
+    """
+    Height from the filtered, wrapped phase
+    phase is centred, unwrapped and deramped (with a plane fitted to N samples, see deramp.remove_plane)
+    and then divided by the wavenumber kz (an array of the same shape, or a scalar)
+    """
+    recentered = zero_phase(phase)
+    unwrapped = unwrap(recentered)
+    unw_deramped = remove_plane(unwrapped,N,seed=seed)
+    return unw_deramped / kz
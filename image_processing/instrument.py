@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Per-stage timing and memory records for the processing scripts
+
+A stage is any block of processing - a SNAP operator, a read or write, a numpy step:
+    with scene('TDX_IFG_GAB_HS_20200101T000000.dim ML 3'):
+        with stage('Multilook',product=image):
+            ...
+For every stage, one JSON line is appended to the stage log with
+    scene, stage, wall time, resident memory (RSS) after the stage and peak RSS so far,
+    bytes read and written by the process, and raster width and height.
+SNAP operators are lazy: their work is done by the write (or read of pixels) that pulls on them,
+so that is where their time shows up.
+
+Records are only written when the TANDEX_STAGE_LOG environment variable names a log file
+(the scripts set it with --stage-log), so worker processes log to the same file.
+A summary of a log, by stage and by scene:
+$python instrument.py <stage_log>
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+from contextlib import contextmanager
+
+# Scene that stages are recorded against (set with scene)
+CURRENT_SCENE = None
+
+# When this batch started (set by configure) - finish only reports stages from then on
+BATCH_START = 0
+
+def log_file():
+    # The stage log, or None when stages are not being recorded
+    return os.environ.get('TANDEX_STAGE_LOG')
+
+def rss():
+    # Resident memory of this process in MB (None where /proc is not available)
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1])*resource.getpagesize()/2**20
+    except OSError:
+        return None
+
+def peak_rss():
+    # Peak resident memory of this process so far, in MB (ru_maxrss is in kB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2**20 if sys.platform == 'darwin' else peak/2**10
+
+def io_counters():
+    # (bytes read, bytes written) by this process so far, including the JVM behind snappy
+    try:
+        with open('/proc/self/io') as file:
+            counters = dict(line.split(': ') for line in file.read().splitlines())
+        return int(counters['read_bytes']), int(counters['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def raster_shape(product):
+    # (width, height) of a SNAP product, or (None, None)
+    if product is None:
+        return None, None
+    try:
+        return product.getSceneRasterWidth(), product.getSceneRasterHeight()
+    except Exception:
+        return None, None
+
+def record(entry):
+    # Appends one record to the stage log - a single short write, so parallel workers do not interleave
+    with open(log_file(),'a') as file:
+        file.write(json.dumps(entry)+'\n')
+
+@contextmanager
+def scene(name):
+    # Stages inside the block are recorded against the scene name
+    global CURRENT_SCENE
+    previous, CURRENT_SCENE = CURRENT_SCENE, name
+    try:
+        yield
+    finally:
+        CURRENT_SCENE = previous
+
+@contextmanager
+def stage(name,product=None,shape=None):
+    """
+    Records the block as one stage of the current scene
+    product (a SNAP product) or shape (width, height) gives the raster dimensions
+    The block can set them once they are known, through the dict it is given:
+        with stage('Multilook') as info:
+            image = createP('Multilook',image,nRgLooks=3)
+            info['product'] = image
+    A stage that raises is recorded with status 'failed'
+    """
+    info = {'product':product,'shape':shape}
+    if log_file() is None:
+        yield info
+        return
+    read0, written0 = io_counters()
+    start = time.time()
+    status = 'done'
+    try:
+        yield info
+    except BaseException:
+        status = 'failed'
+        raise
+    finally:
+        seconds = time.time() - start
+        read1, written1 = io_counters()
+        width, height = info['shape'] if info['shape'] is not None else raster_shape(info['product'])
+        record({'scene':CURRENT_SCENE,
+                'stage':name,
+                'status':status,
+                'start':start,
+                'seconds':seconds,
+                'rss_MB':rss(),
+                'peak_rss_MB':peak_rss(),
+                'read_MB':None if read0 is None else (read1-read0)/2**20,
+                'written_MB':None if written0 is None else (written1-written0)/2**20,
+                'width':width,
+                'height':height,
+                'pid':os.getpid()})
+
+# Command line use ---------------------------
+
+def add_argument(parser):
+    # Adds the --stage-log option to a script's argument parser
+    parser.add_argument('--stage-log',default=log_file(),
+                        help='append per-stage timing and memory records to this file (JSON lines)')
+
+def configure(stage_log):
+    # Turns recording on for this process and the workers it starts
+    global BATCH_START
+    BATCH_START = time.time()
+    if stage_log is not None:
+        os.environ['TANDEX_STAGE_LOG'] = os.path.abspath(stage_log)
+
+def finish():
+    # Prints the summary of the stages recorded in this batch, if any were
+    if log_file() is not None and os.path.exists(log_file()):
+        records = [r for r in read_log(log_file()) if r['start'] >= BATCH_START]
+        if records:
+            print('*************')
+            report(records)
+
+def read_log(path):
+    # Records of a stage log (lines that cannot be parsed are skipped)
+    records = []
+    with open(path) as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def summarise(records,key):
+    # Totals of the records grouped by key ('stage' or 'scene'), in order of total time
+    groups = {}
+    for r in records:
+        g = groups.setdefault(r[key],{'count':0,'seconds':0.0,'peak_rss_MB':0.0,
+                                      'read_MB':0.0,'written_MB':0.0,'failed':0})
+        g['count'] += 1
+        g['seconds'] += r['seconds']
+        g['peak_rss_MB'] = max(g['peak_rss_MB'],r['peak_rss_MB'] or 0)
+        g['read_MB'] += r['read_MB'] or 0
+        g['written_MB'] += r['written_MB'] or 0
+        g['failed'] += r['status'] == 'failed'
+    return sorted(groups.items(),key=lambda item: -item[1]['seconds'])
+
+def report(records):
+    # Prints the time, memory and I/O of each stage and scene of a batch
+    total = sum(r['seconds'] for r in records) or 1
+    for key in ['stage','scene']:
+        print('{:<50}{:>7}{:>12}{:>8}{:>12}{:>12}{:>12}'.format(
+            'By '+key,'count','seconds','%','peak MB','read MB','written MB'))
+        for name, g in summarise(records,key):
+            print('{:<50}{:>7}{:>12.1f}{:>8.1f}{:>12.0f}{:>12.0f}{:>12.0f}'.format(
+                str(name)[-50:],g['count'],g['seconds'],100*g['seconds']/total,
+                g['peak_rss_MB'],g['read_MB'],g['written_MB'])
+                  + ('  ('+str(g['failed'])+' failed)' if g['failed'] else ''))
+        print('')
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise a stage log')
+    parser.add_argument('stage_log')
+    args = parser.parse_args()
+    report(read_log(args.stage_log))
+
+if __name__ == '__main__':
+    main()
@@ -8,32 +8,61 @@ This script takes a command line argument for the number of range looks .
 Call this script inside a folder containing TDX interferograms (with SRTM phase removed).
 For each interferogram, an unwrapped, terrain-corrected phase height image will be processed and saved.
 
+Several look counts can be given at once, and scenes can be spread over a pool of workers:
+    $python make_DEMs.py 3 8 16 -j 6
+Each scene is processed in its own scratch directory, so several runs can share a folder.
+With --sweep, each scene is read once and processed at every look count in the same task.
+Failed scenes are retried, and a summary of any that still fail is printed at the end.
+
 """
 
-from snappy import ProductIO, HashMap, GPF, ProductUtils
+from snappy import ProductIO, ProductUtils
 import snappy
 import glob
 from scipy.linalg import lstsq
 import numpy as np
 import sys
 import os
+import argparse
+import shutil
+import tempfile
+import traceback
+import hashlib
 sys.path.append('/home/s1332488/code/tandex')
-from deramp import remove_plane
+from deramp import plane, normal_equations, solve_normal
+import instrument
+import op_cache
+import workers
+import dem
+from dem import dem_parameters
+from sites import site_code
+from instrument import stage, scene
+from op_cache import create_product
+from height_core import (neighbour_pairs, jump_counts, unwrap_with_offset,
+                         kz_scale, grid_geometry, phase_to_height)
 
 def createP(function, inputProduct, writeout=False, **kwargs):
     # pythonic version of GPF.createProduct()
     # function is string of SNAP operator
     # inputProduct is SNAP product object
     # kwargs contains any parameters to pass to the operator
-    p = HashMap()
-    for arg in kwargs:
-        p.put(arg,kwargs.get(arg))
-    result = GPF.createProduct(function,p,inputProduct)
+    # The operator itself is lazy - its work is timed in the stage that writes (or reads) its output
+    # With an operator cache (see op_cache.py), outputs of unchanged inputs are read from the cache
+    with stage(function) as info:
+        result = create_product(function,kwargs,inputProduct)
+        info['product'] = result
     if writeout != False:
-        ProductIO.writeProduct(result,writeout,'BEAM-DIMAP')
+        with stage(function+' (write)',product=result):
+            ProductIO.writeProduct(result,writeout,'BEAM-DIMAP')
     else:
         return result
 
+def read_product(path):
+    # ProductIO.readProduct, recorded as a stage
+    with stage('read') as info:
+        info['product'] = ProductIO.readProduct(path)
+    return info['product']
+
 def get_data(imageBand):
     # takes SNAP image band object and returns a numpy array containing the data in that band
     W,H = imageBand.getRasterWidth(), imageBand.getRasterHeight()
@@ -41,51 +70,8 @@ def get_data(imageBand):
     imageBand.readPixels(0,0,W,H,array)
     return array.reshape(H,W).transpose()
 
-def zero_phase(wrapped_phase):
-    # Return phase values centered roughly on zero
-    vals,binedges=np.histogram(wrapped_phase,bins=50)
-    binsize = binedges[1] - binedges[0]
-    peak = binedges[vals.argmax()] + 0.5*binsize
-    recentered = wrapped_phase - peak
-    return recentered
-
-def cost_fun(recentered,offset):
-    # Calculates how many 'jumps' remain after "quasi-unwrapping"
-    # The quasi unwrapping simply assumes all values are within a 
-    # 2pi interval and determines the offset required to center them
-    if offset < 0:
-        a = recentered + (recentered < offset)*2*np.pi
-    else:
-        a = recentered - (recentered > offset)*2*np.pi
-    cost1 = (np.abs(a[:-1] - a[1:]) > 5).sum()
-    cost2 = (np.abs(a[:,:-1] - a[:,1:]) > 5).sum()
-    return cost1+cost2
-
-def unwrap(zeroed_phase):
-    # Quasi unwrapping, where we assume all values lie already within one 2pi interval
-    vals,binedges=np.histogram(zeroed_phase,bins=50)
-    binsize = binedges[1] - binedges[0]
-    initial_guess = binedges[vals.argmin()] + 0.5*binsize
-    tryout = np.linspace(initial_guess-0.2,initial_guess+0.2,25)
-    costs = [cost_fun(zeroed_phase,offset) for offset in tryout]
-    fit = np.polyfit(tryout,costs,2)
-    offset = -fit[1]/(2*fit[0])
-    if offset < 0:
-        unwrapped = zeroed_phase + (zeroed_phase < offset)*2*np.pi
-    else:
-        unwrapped = zeroed_phase - (zeroed_phase > offset)*2*np.pi
-    return unwrapped
-
-def get_kz(image):
-    # Get array of wavenumber values for every pixel
-    W = image.getBandAt(0).getRasterWidth()
-    H = image.getBandAt(0).getRasterHeight()
-    rangeT = np.asarray(image.getTiePointGrid('slant_range_time')
-                    .readPixels(0,0,W,H,np.zeros(W*H,dtype=np.float32))
-                   ).reshape(H,W).transpose()
-    theta = np.asarray(image.getTiePointGrid('incident_angle')
-                  .readPixels(0,0,W,H,np.zeros(W*H,dtype=np.float32))
-                  ).reshape(H,W).transpose()
+def kz_constants(image):
+    # Scene constants needed for the wavenumber: wavelength, effective baseline and HoA
     c = 3*10**8
     metadata = image.getMetadataRoot()
     freq = float(str(metadata
@@ -93,7 +79,6 @@ def get_kz(image):
               .getAttribute('radar_frequency')
               .getData()))
     wavelength = c / (freq*10**6)
-    theta = np.deg2rad(theta)
     baseline = float(str(metadata
                          .getElement('CoSSC_Metadata')
                          .getElement('cossc_product')
@@ -108,32 +93,257 @@ def get_kz(image):
                     .getElement('acquisitionGeometry')
                     .getAttribute('heightOfAmbiguity')
                     .getData()))
-    R = 0.5 * c * rangeT*10**-9
-    kz = 4*np.pi*baseline / (wavelength*R*np.sin(theta))
-    if HoA < 0:
-        kz = -kz
-    return kz
+    return wavelength, baseline, HoA
+
+def coarse_grid(image,name):
+    # Values of a tie-point grid at the tie points, with the layout needed to interpolate them
+    grid = image.getTiePointGrid(name)
+    shape = (grid.getGridHeight(),grid.getGridWidth())
+    layout = (shape,grid.getOffsetX(),grid.getOffsetY(),grid.getSubSamplingX(),grid.getSubSamplingY())
+    values = np.array(grid.getTiePoints(),dtype=np.float64).reshape(shape)
+    return layout, values
+
+def range_geometry(image,y0=0,h=None):
+    """
+    R sin(theta) for rows y0 to y0+h (default all), in SNAP (row-major) orientation
+    R is slant range and theta the incidence angle (see height_core.grid_geometry)
+    """
+    W = image.getBandAt(0).getRasterWidth()
+    H = image.getBandAt(0).getRasterHeight()
+    if h is None:
+        h = H - y0
+    return grid_geometry(coarse_grid(image,'slant_range_time'),coarse_grid(image,'incident_angle'),W,y0,h)
+
+def geometry_cache_file(image,looks,cache_dir):
+    # Cache file name - keyed by the tie points and layout the geometry is interpolated from, and the raster size
+    W = image.getBandAt(0).getRasterWidth()
+    H = image.getBandAt(0).getRasterHeight()
+    key = hashlib.sha256(str((W,H)).encode())
+    for name in ('slant_range_time','incident_angle'):
+        layout, values = coarse_grid(image,name)
+        key.update(str(layout).encode())
+        key.update(values.tobytes())
+    return os.path.join(cache_dir,'geometry_ML'+str(looks)+'_'+key.hexdigest()[:16]+'.npy')
+
+def cached_range_geometry(image,looks,cache_dir,tile_rows=1024):
+    """
+    range_geometry for the whole scene, cached on disk in cache_dir
+    Returns a read-only memory-mapped (H x W) array
+    Scenes share a cache file only if their tie-point grids are identical (see geometry_cache_file)
+    """
+    path = geometry_cache_file(image,looks,cache_dir)
+    if not os.path.exists(path):
+        W = image.getBandAt(0).getRasterWidth()
+        H = image.getBandAt(0).getRasterHeight()
+        os.makedirs(cache_dir,exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=cache_dir,suffix='.npy')
+        os.close(handle)
+        geometry = np.lib.format.open_memmap(temp,mode='w+',dtype=np.float32,shape=(H,W))
+        for y0 in range(0,H,tile_rows):
+            h = min(tile_rows,H-y0)
+            geometry[y0:y0+h] = range_geometry(image,y0,h)
+        geometry.flush()
+        del geometry
+        os.replace(temp,path) # atomic, so parallel workers never see a partial file
+    return np.load(path,mmap_mode='r')
+
+def get_kz(image,looks=None,cache_dir=None):
+    # Get array of wavenumber values for every pixel
+    # If cache_dir is given, the geometry is cached there (see cached_range_geometry)
+    if cache_dir is not None:
+        geometry = cached_range_geometry(image,looks,cache_dir)
+    else:
+        geometry = range_geometry(image)
+    return kz_scale(*kz_constants(image)) / geometry.transpose()
+
+def height_product(image,height=None,rasters=None):
+    """
+    Builds an in-memory product holding the height array
+    alongside the Phase and coh bands, metadata and tie-point grids of image
+    height is a flat float32 array in SNAP (row-major) order
+    (if height is None the height band is left for the caller to add)
+    rasters is a dict of the Phase and coh arrays already read from image, in the same order.
+    They become the data of those bands, so reading the product does not run image's operators again
+    (without rasters, the bands are copied from image and read from it when they are needed)
+    Nothing is written to disk - the product can be passed straight to an operator
+    """
+    W = image.getBandAt(0).getRasterWidth()
+    H = image.getBandAt(0).getRasterHeight()
+    targetP = snappy.Product('height_product','height_type',W,H)
+    ProductUtils.copyMetadata(image,targetP)
+    ProductUtils.copyTiePointGrids(image,targetP)
+    ProductUtils.copyGeoCoding(image,targetP)
+    for band in ['Phase','coh']:
+        bandname= [x for x in list(image.getBandNames()) if band in x][0]
+        if rasters is None:
+            ProductUtils.copyBand(bandname,image,band,targetP,True)
+        else:
+            targetB = ProductUtils.copyBand(bandname,image,band,targetP,False)
+            targetB.setRasterData(snappy.ProductData.createInstance(rasters[band]))
+    if height is not None:
+        targetB = targetP.addBand('height', snappy.ProductData.TYPE_FLOAT32)
+        targetB.setUnit('m')
+        targetB.setRasterData(snappy.ProductData.createInstance(height))
+    return targetP
+
+# Tiled processing ----------------------------
+# For scenes too large to hold in memory, the phase is streamed in blocks of rows.
+# The global statistics (histogram peak, unwrapping offset, plane) depend on one another,
+# so each is gathered in its own streaming pass before the final pass applies them.
+# Blocks are kept in SNAP (row-major) orientation: rows are y, columns are x.
+
+def read_rows(band,y0,h):
+    # Reads h rows starting at row y0 from a band
+    W = band.getRasterWidth()
+    return np.asarray(band.readPixels(0,y0,W,h,np.zeros(W*h))).reshape(h,W)
+
+def row_blocks(raster,tile_rows):
+    # Iterates over (y0, block) for consecutive blocks of tile_rows rows
+    H = raster.getRasterHeight()
+    for y0 in range(0,H,tile_rows):
+        h = min(tile_rows,H-y0)
+        yield y0, read_rows(raster,y0,h)
+
+def tiled_statistics(phase,tile_rows):
+    """
+    Streams the phase band to find the quantities used by zero_phase, unwrap and remove_plane
+    Returns (peak, offset, coeff)
+    peak is subtracted to center the phase, offset is the unwrapping offset
+    and coeff is the best fit plane (see deramp.plane) to the unwrapped phase
+    """
+    # Histogram peak - same 50 bins as zero_phase
+    lowest, highest = np.inf, -np.inf
+    for y0, block in row_blocks(phase,tile_rows):
+        lowest = min(lowest,np.nanmin(block))
+        highest = max(highest,np.nanmax(block))
+    vals = np.zeros(50,dtype=int)
+    for y0, block in row_blocks(phase,tile_rows):
+        vals += np.histogram(block[~np.isnan(block)],bins=50,range=(lowest,highest))[0]
+    binedges = np.linspace(lowest,highest,51)
+    binsize = binedges[1] - binedges[0]
+    peak = binedges[vals.argmax()] + 0.5*binsize
+    
+    # Unwrapping offset - the histogram of the zeroed phase is the same one, shifted by peak
+    initial_guess = binedges[vals.argmin()] + 0.5*binsize - peak
+    tryout = np.linspace(initial_guess-0.2,initial_guess+0.2,25)
+    costs = np.zeros(tryout.size,dtype=int)
+    window = (tryout[0],tryout[-1])
+    previous = None
+    for y0, block in row_blocks(phase,tile_rows):
+        block = block - peak
+        lo, hi, outside = neighbour_pairs(block,window=window)
+        costs += jump_counts(lo,hi,tryout,outside=outside)
+        if previous is not None:
+            # Pairs straddling the boundary with the previous block
+            lo, hi, outside = neighbour_pairs(np.vstack([previous,block[:1]]),axes=(0,),window=window)
+            costs += jump_counts(lo,hi,tryout,outside=outside)
+        previous = block[-1:]
+    fit = np.polyfit(tryout,costs,2)
+    offset = -fit[1]/(2*fit[0])
+    
+    # Best fit plane - x is the column index and y the row index, as in remove_plane
+    AtA, AtB = np.zeros((3,3)), np.zeros(3)
+    for y0, block in row_blocks(phase,tile_rows):
+        unwrapped = unwrap_with_offset(block - peak,offset)
+        block_AtA, block_AtB = normal_equations(unwrapped.T,offset=(0,y0))
+        AtA += block_AtA
+        AtB += block_AtB
+    coeff = solve_normal(AtA,AtB)
+    return peak, offset, coeff
+
+def tiled_height(image,outfile,tile_rows,looks=None,kz_cache=None):
+    """
+    Tiled equivalent of the numpy processing in phaseToHeight
+    image is the filtered interferogram product
+    The height product is written to outfile block by block, and then read back
+    The plane is fitted to all valid pixels rather than to a random sample
+    looks and kz_cache are passed on to get_kz
+    """
+    phase = image.getBand([x for x in list(image.getBandNames()) if 'Phase' in x][0])
+    with stage('tiled statistics',product=image):
+        peak, offset, coeff = tiled_statistics(phase,tile_rows)
+    scale = kz_scale(*kz_constants(image))
+    if kz_cache is not None:
+        geometry = cached_range_geometry(image,looks,kz_cache,tile_rows)
+    
+    W = phase.getRasterWidth()
+    targetP = height_product(image)
+    targetP.setProductReader(ProductIO.getProductReader('BEAM-DIMAP'))
+    ProductIO.writeProduct(targetP,outfile,'BEAM-DIMAP')
+    targetB = targetP.addBand('height', snappy.ProductData.TYPE_FLOAT32)
+    targetB.setUnit('m')
+    targetP.setProductWriter(ProductIO.getProductWriter('BEAM-DIMAP'))
+    targetP.writeHeader(outfile)
+    x = np.arange(W)
+    with stage('tiled height (write)',product=image):
+        for y0, block in row_blocks(phase,tile_rows):
+            h = block.shape[0]
+            y = np.arange(y0,y0+h)[:,np.newaxis]
+            deramped = unwrap_with_offset(block - peak,offset) - plane(coeff,x,y)
+            if kz_cache is not None:
+                kz = scale / geometry[y0:y0+h]
+            else:
+                kz = scale / range_geometry(image,y0,h)
+            height = (deramped / kz).astype(np.float32)
+            targetB.writePixels(0,y0,W,h,height.flatten())
+        targetP.closeIO()
+    return read_product(outfile)
 
 # ------------------------------------- #
 
-def phaseToHeight(inputfile,NLOOKS):
+def phaseToHeight(inputfile,NLOOKS,workdir='.',in_memory=False,tile_rows=None,kz_cache=None):
     """
     This is the central processing chain
     inputfile is a string of an interferogram file name
     NLOOKS is the number of range looks to be used for multi-looking
+    workdir is the directory where temporary products are written
+    in_memory=True keeps the whole operator graph in memory:
+        the filtered phase is read straight into numpy and the height product
+        is fed directly to Terrain-Correction, so only the output touches disk
+    tile_rows streams the numpy processing in blocks of that many rows (see tiled_height),
+        so memory use is bounded by the block size rather than the scene size.
+        The intermediate products are then always written to workdir.
+    kz_cache is a directory where the scene geometry used for kz is cached (see get_kz)
                                     #
     Multi-looking, Goldstein phase filtering, unwrapping and terrain correction are performed
     The output is then written to file in BEAM-DIMAP format
     """
     
-    TEMP1 = 'ML_fl_temp.dim'
-    TEMP2 = 'height_temp.dim'
-    OUT = '_'.join([inputfile.split('.dim')[0],
-                    'ML',
-                    str(NLOOKS),
-                    'height_TC.dim'
-                    ])
-    image = ProductIO.readProduct(inputfile)
+    OUT = output_file(inputfile,NLOOKS)
+    image = read_product(inputfile)
+    productToHeight(image,NLOOKS,OUT,workdir,in_memory,tile_rows,kz_cache)
+
+def phaseToHeights(inputfile,looks,workdir='.',in_memory=False,tile_rows=None,kz_cache=None):
+    """
+    phaseToHeight for several numbers of range looks (a look count sweep)
+    The interferogram is read once and every look count is processed from the same product,
+    each with its own temporary products in a subdirectory of workdir
+    looks is a list of numbers of range looks, the other arguments are as for phaseToHeight
+    """
+    image = read_product(inputfile)
+    for NLOOKS in looks:
+        subdir = os.path.join(workdir,'ML_'+str(NLOOKS))
+        os.makedirs(subdir,exist_ok=True)
+        productToHeight(image,NLOOKS,output_file(inputfile,NLOOKS),subdir,in_memory,tile_rows,kz_cache)
+
+def output_file(inputfile,NLOOKS):
+    # Name of the terrain-corrected height product made from inputfile
+    return '_'.join([inputfile.split('.dim')[0],
+                     'ML',
+                     str(NLOOKS),
+                     'height_TC.dim'
+                     ])
+
+def productToHeight(image,NLOOKS,OUT,workdir='.',in_memory=False,tile_rows=None,kz_cache=None):
+    """
+    phaseToHeight for an interferogram product that is already open
+    (e.g. the in-memory output of earlier operators - see pipeline.py)
+    OUT is the name of the output file, the other arguments are as for phaseToHeight
+    """
+    if in_memory and tile_rows:
+        raise ValueError('in_memory and tile_rows cannot be combined')
+    TEMP1 = os.path.join(workdir,'ML_fl_temp.dim')
+    TEMP2 = os.path.join(workdir,'height_temp.dim')
     
     # SNAP Processing -------------------------------
     image = createP('Multilook',image,nRgLooks=NLOOKS)
@@ -141,60 +351,125 @@ def phaseToHeight(inputfile,NLOOKS):
                     alpha=0.2,
                     useCoherenceMask=True,
                     coherenceThreshold=0.2,
-                    writeout=TEMP1)
+                    writeout=False if in_memory else TEMP1)
     
     # Numpy processing -----------------------------
-    image = ProductIO.readProduct(TEMP1)
-    phase = image.getBand([x for x in list(image.getBandNames()) if 'Phase' in x][0])
-    phase_data = get_data(phase)
-    recentered = zero_phase(phase_data)
-    unwrapped = unwrap(recentered)
-    unw_deramped = remove_plane(unwrapped, 10000)
-    height = unw_deramped / get_kz(image)
-    height = height.transpose().flatten()
-    
-    # Write to target Product--------------------------
-    W = image.getBandAt(0).getRasterWidth()
-    H = image.getBandAt(0).getRasterHeight()
-    targetP = snappy.Product('height_product','height_type',W,H)
-    ProductUtils.copyMetadata(image,targetP)
-    ProductUtils.copyTiePointGrids(image,targetP)
-    targetP.setProductWriter(ProductIO.getProductWriter('BEAM-DIMAP'))
-    for band in ['Phase','coh']:
-        bandname= [x for x in list(image.getBandNames()) if band in x][0]
-        ProductUtils.copyBand(bandname,image,band,targetP,True)
-    targetP.setProductReader(ProductIO.getProductReader('BEAM-DIMAP'))
-    ProductIO.writeProduct(targetP,TEMP2,'BEAM-DIMAP')
-    targetB = targetP.addBand('height', snappy.ProductData.TYPE_FLOAT32)
-    targetB.setUnit('m')
-    targetP.setProductWriter(ProductIO.getProductWriter('BEAM-DIMAP'))
-    targetP.writeHeader(TEMP2)
-    targetB.writePixels(0,0,W,H,height)
-    targetP.closeIO()
+    if not in_memory:
+        image = read_product(TEMP1)
+    if tile_rows:
+        targetP = tiled_height(image,TEMP2,tile_rows,looks=NLOOKS,kz_cache=kz_cache)
+    else:
+        phase = image.getBand([x for x in list(image.getBandNames()) if 'Phase' in x][0])
+        with stage('read phase',product=image):
+            phase_data = get_data(phase)
+        with stage('kz',product=image):
+            kz = get_kz(image,looks=NLOOKS,cache_dir=kz_cache)
+        with stage('unwrap and height',product=image):
+            height = phase_to_height(phase_data,kz)
+            height = height.transpose().flatten().astype(np.float32)
+        rasters = None
+        if in_memory:
+            # image is still the lazy Goldstein output: Terrain-Correction is given the arrays
+            # already read instead, so it does not run the operators again for Phase and coh
+            coh = image.getBand([x for x in list(image.getBandNames()) if 'coh' in x][0])
+            with stage('read coh',product=image):
+                rasters = {'Phase':phase_data.transpose().flatten().astype(np.float32),
+                           'coh':get_data(coh).transpose().flatten().astype(np.float32)}
+        
+        # Target Product--------------------------
+        targetP = height_product(image,height,rasters)
+        if not in_memory:
+            with stage('height (write)',product=targetP):
+                ProductIO.writeProduct(targetP,TEMP2,'BEAM-DIMAP')
+            targetP = read_product(TEMP2)
     
     # Terrain correction-------------------------
-    image = ProductIO.readProduct(TEMP2)
+    # The local DEM of the site is used if there is one (see dem.py)
     image = createP('Terrain-Correction',
-                    image,
+                    targetP,
                     alignToStandardGrid='true',
-                    demName='SRTM 1Sec HGT',
-                    saveDEM='true')
-    ProductIO.writeProduct(image,OUT,'BEAM-DIMAP')
+                    saveDEM='true',
+                    **dem_parameters(site_code(os.path.basename(OUT))))
+    with stage('Terrain-Correction (write)',product=image):
+        ProductIO.writeProduct(image,OUT,'BEAM-DIMAP')
     
 #-----------------------------------------------------------
 
+def process_scene(task):
+    """
+    Worker for the scene scheduler
+    task is a tuple (inputfile, NLOOKS, scratch, retries, options)
+    where options is a dict of keyword arguments for phaseToHeight
+    NLOOKS may also be a list, for a look count sweep of one scene (see phaseToHeights)
+    Each attempt runs in a fresh temporary directory inside scratch,
+    which is removed afterwards whether or not the attempt succeeded.
+    Returns (inputfile, NLOOKS, error) where error is None on success
+    """
+    inputfile, NLOOKS, scratch, retries, options = task
+    error = None
+    for attempt in range(retries+1):
+        workdir = tempfile.mkdtemp(prefix='make_DEMs_',dir=scratch)
+        try:
+            with scene(inputfile+' ML '+str(NLOOKS)):
+                if isinstance(NLOOKS,list):
+                    phaseToHeights(inputfile,NLOOKS,workdir=workdir,**options)
+                else:
+                    phaseToHeight(inputfile,NLOOKS,workdir=workdir,**options)
+            return inputfile, NLOOKS, None
+        except Exception:
+            error = traceback.format_exc()
+            print('FAILED (attempt '+str(attempt+1)+' of '+str(retries+1)+'): '
+                  +inputfile+' ML '+str(NLOOKS))
+            print(error)
+        finally:
+            shutil.rmtree(workdir,ignore_errors=True)
+    return inputfile, NLOOKS, error
+
 def main():
-    NLOOKS = int(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Phase-to-height processing of TDX interferograms')
+    parser.add_argument('NLOOKS',type=int,nargs='+',help='number(s) of range looks')
+    workers.add_argument(parser)
+    parser.add_argument('--scratch',default='.',help='directory for temporary products')
+    parser.add_argument('--retries',type=int,default=1,help='number of retries for a failed scene')
+    parser.add_argument('--in-memory',action='store_true',
+                        help='keep intermediate products in memory instead of writing them to scratch')
+    parser.add_argument('--tile-rows',type=int,default=None,
+                        help='stream the numpy processing in blocks of this many rows (for very large scenes)')
+    parser.add_argument('--kz-cache',default=None,
+                        help='directory for caching the scene geometry used to compute kz')
+    parser.add_argument('--sweep',action='store_true',
+                        help='process all look counts of a scene in one task, reading it once')
+    instrument.add_argument(parser)
+    op_cache.add_arguments(parser)
+    dem.add_argument(parser)
+    args = parser.parse_args()
+    instrument.configure(args.stage_log)
+    op_cache.configure(args.op_cache,args.op_cache_gb)
+    dem.configure(args.dem_dir)
+    options = {'in_memory':args.in_memory,'tile_rows':args.tile_rows,'kz_cache':args.kz_cache}
+    
     files = [f for f in glob.glob('TDX_IFG*.dim') if 'height' not in f]
-    N = len(files)
+    if args.sweep:
+        tasks = [(f,args.NLOOKS,args.scratch,args.retries,options) for f in files]
+    else:
+        tasks = [(f,L,args.scratch,args.retries,options) for f in files for L in args.NLOOKS]
+    N = len(tasks)
+    print('Processing '+str(len(files))+' interferograms at '+str(len(args.NLOOKS))
+          +' look count(s) with '+str(args.workers)+' worker(s)')
+    
+    failed = []
     i=1
-    for f in files:
+    for f, L, error in workers.run(process_scene,tasks,args.workers):
         print('******')
-        print('Processing: '+str(i)+' of '+str(N))
-        print(f)
-        print('...')
-        phaseToHeight(f,NLOOKS)
-        print('Done')
+        print('Done: '+str(i)+' of '+str(N)+' ('+f+', ML '+str(L)+')'
+              +('' if error is None else ' - FAILED'))
+        if error is not None:
+            failed.append(f+' ML '+str(L))
         i+=1
-        
-main()
\ No newline at end of file
+    workers.summary(N,failed)
+    instrument.finish()
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
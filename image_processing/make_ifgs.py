@@ -10,15 +10,25 @@ Code for producing Interferograms from TanDEM-X images
 Takes one command line argument: filename of a text file where each line is the 
     path to a TDX COSSC image (xml file)
     
-Each COSSC image is processed in turn and saved with a customised name to the location
+Each COSSC image is processed and saved with a customised name to the location
     specified by OUT_FOLDER
+Images can be processed concurrently with -j <number of workers>.
+The status, duration and output size of every image is recorded in a manifest (CSV),
+    and images already recorded as done are skipped when the script is re-run.
 """
 
 from snappy import ProductIO
-from snappy import GPF
-from snappy import HashMap
-import sys
+import os
 import os.path as path
+import argparse
+import csv
+import time
+import traceback
+import instrument
+import op_cache
+import workers
+from instrument import stage, scene
+from op_cache import create_product
 
 # OUT_FOLDER set to storage place of interferograms
 OUT_FOLDER = '/disk/scratch/local.4/harry/interferograms/'
@@ -41,7 +51,7 @@ def ifg_file(TDX_path):
     elif country == 'Peru':
         country = 'PER'
     else:
-        raise 'Country not recognised'
+        raise ValueError('Country not recognised: '+country)
     datetime = TDX_path.split('/')[-1].split('_')[-2]
     
     OUT_FILE = '_'.join(['TDX','IFG',country,mode,datetime])+'.dim'
@@ -54,30 +64,110 @@ def do_ifg(path):
     Add in parameters to p if required (see gpt Interferogram -h for details)
     """
     target = ifg_file(path)
-    image = ProductIO.readProduct(path)
-    p = HashMap()
-    image = GPF.createProduct('Interferogram',p,image)
-    ProductIO.writeProduct(image,target,'BEAM-DIMAP')
+    with stage('read') as info:
+        image = info['product'] = ProductIO.readProduct(path)
+    image = interferogram(image)
+    # Interferogram is lazy - its work is done by the write
+    with stage('Interferogram (write)',product=image):
+        ProductIO.writeProduct(image,target,'BEAM-DIMAP')
+
+def interferogram(image):
+    # Interferogram operator on an open COSSC product - the result stays in memory
+    # (unless the operator cache is on - see op_cache.py)
+    return create_product('Interferogram',{},image)
     
+# Batch running -------------------------------------------------
+
+MANIFEST_FIELDS = ['cossc','target','status','started','duration_s','output_bytes','error']
+
+def output_size(target):
+    # Size in bytes of a BEAM-DIMAP product - the .dim header plus its .data folder
+    size = path.getsize(target) if path.exists(target) else 0
+    data = target.split('.dim')[0] + '.data'
+    for folder, subfolders, files in os.walk(data):
+        size += sum(path.getsize(path.join(folder,f)) for f in files)
+    return size
+
+def read_manifest(manifest):
+    # Returns a dict of manifest rows, keyed by COSSC path
+    if not path.exists(manifest):
+        return {}
+    with open(manifest,'r') as file:
+        return {row['cossc']:row for row in csv.DictReader(file)}
+
+def write_manifest(manifest,rows):
+    # Rewrites the whole manifest, replacing the old one only once the new one is complete
+    temp = manifest + '.tmp'
+    with open(temp,'w') as file:
+        writer = csv.DictWriter(file,fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        for cossc in sorted(rows):
+            writer.writerow(rows[cossc])
+    os.replace(temp,manifest)
+
+def is_done(row):
+    return row is not None and row['status'] == 'done' and path.exists(row['target'])
+
+def run_job(cossc):
+    """
+    Runs do_ifg for one COSSC image, catching any failure
+    Returns the manifest row for the image
+    """
+    row = {'cossc':cossc,'target':'','status':'failed','started':time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'duration_s':'','output_bytes':'','error':''}
+    start = time.time()
+    try:
+        row['target'] = ifg_file(cossc)
+        with scene(cossc):
+            do_ifg(cossc) # here is where it happens
+        row['status'] = 'done'
+        row['output_bytes'] = output_size(row['target'])
+    except Exception:
+        row['error'] = traceback.format_exc().strip().split('\n')[-1]
+        print(traceback.format_exc())
+    row['duration_s'] = round(time.time() - start,1)
+    return row
+
 # Here is the main program----------------------------------------
 
-with open(sys.argv[1],'r') as file:
-    COSSC_list = file.readlines()
-    N = len(COSSC_list)
-    print('Processing '+str(N)+' TDX images')
+def main():
+    parser = argparse.ArgumentParser(description='Interferogram generation from TDX COSSC images')
+    parser.add_argument('cossc_list',help='text file where each line is the path to a TDX COSSC image')
+    workers.add_argument(parser,'images')
+    parser.add_argument('--manifest',default=path.join(OUT_FOLDER,'ifg_manifest.csv'),
+                        help='CSV file recording the status of each image')
+    instrument.add_argument(parser)
+    op_cache.add_arguments(parser)
+    args = parser.parse_args()
+    instrument.configure(args.stage_log)
+    op_cache.configure(args.op_cache,args.op_cache_gb)
+    
+    with open(args.cossc_list,'r') as file:
+        COSSC_list = [path.join(STORAGE_DIR,line.rstrip('\n')[2:]) for line in file if line.strip()]
+    rows = read_manifest(args.manifest)
+    todo = [cossc for cossc in COSSC_list if not is_done(rows.get(cossc))]
+    N = len(todo)
+    print('Processing '+str(N)+' TDX images ('+str(len(COSSC_list)-N)+' already done)')
     print('Starting...')
-    for i in range(N):
+    
+    i = 1
+    for row in workers.run(run_job,todo,args.workers):
+        rows[row['cossc']] = row
+        write_manifest(args.manifest,rows)
         print('***')
-        print('Calculating Interferogram '+str(i+1)+' of '+str(N))
-        try: 
-            cossc = path.join(STORAGE_DIR,COSSC_list[i][2:-1])
-            do_ifg(cossc) # here is where it happens
-        except:
-            print(cossc)
-            print(path.exists(cossc))
-            print('UNSUCCESSFUL')  
-        
-        print('*************')
-        print('[DONE]')
-        print('*************')
-    
\ No newline at end of file
+        print('Interferogram '+str(i)+' of '+str(N)+': '+row['status'].upper()
+              +' ('+str(row['duration_s'])+' s)')
+        print(row['cossc'])
+        if row['status'] != 'done':
+            print(path.exists(row['cossc']))
+            print('UNSUCCESSFUL')
+        i += 1
+    
+    failed = [r['cossc'] for r in rows.values() if r['cossc'] in todo and r['status'] != 'done']
+    workers.summary(N,failed)
+    print('[DONE] see '+args.manifest)
+    instrument.finish()
+    print('*************')
+
+if __name__ == '__main__':
+    main()
@@ -8,57 +8,249 @@ This script merges phase height images of the:
      same pass;
      same number of looks;
      and same region.
-(It determines this by looking for a pattern in the file names).
+(It finds these groups in the scene catalogue - see catalogue.py).
 The result is a net CDF file where TIME is one of the dimensions.
+Scenes are regridded onto the grid of the first and written one at a time into a chunked,
+compressed stack, so only one scene is held in memory.
 
 Call this script inside the folder where the unmerged net CDF files are.
+Existing merged files are updated in place with the scenes they are missing
+(pass --rebuild to merge everything from scratch).
 """
 
 import xarray as xr
+import numpy as np
+import netCDF4
 from datetime import datetime
-import glob
-
-def add_time(file):
-    ds = xr.open_dataset(file)
-    # Same spatial grid and resolution
-    # Then, add the time
-    time = file.split('_')[4]
-    time = datetime.strptime(time,'%Y%m%dT%H%M%S')
-    ds = ds.assign_coords(t=time)
-    
-    ds['height'] = ds.height_HH.expand_dims('t')
-    ds['metadata'] = ds.metadata.expand_dims('t')
-    #ds['localIncidenceAngle'] = ds.localIncidenceAngle.expand_dims('t')
-    ds['coh'] = ds.coh_HH.expand_dims('t')
-    #ds['intensity'] = ds[intensity[0]].expand_dims('t')
-    ds = ds.drop('Phase_HH')
-    ds = ds.drop('height_HH')
-    ds = ds.drop('coh_HH')
-    ds = ds.drop('elevation')
-    return ds
-
-def merge(patterns):
-    ff = [f for f in files if all([P in f.split('_') for P in patterns])]
-    OUT = '_'.join(patterns).split('.nc')[0]+'_merged.nc'
-    print('merging '+str(len(ff))+' images')
-    ref = xr.open_dataset(ff[0])
-    LAT,LON,ELEV = ref.lat, ref.lon, ref.elevation
-    datasets = [add_time(f) for f in ff]
-    datasets = [ds.interp(lat=LAT,lon=LON) for ds in datasets]
-    DS = xr.merge(datasets)
-    DS['elevation'] = ELEV
-    DS.to_netcdf(OUT)
-    
-#------------------------------------------------------------------------
+import os
+import tempfile
+import argparse
+import catalogue
+from export_chunked import CHUNK, chunk_sizes
+
+# Variables of the merged stack and the variables of the exported scenes they come from
+STACKED = {'height':'height_HH','coh':'coh_HH'}
+
+TIME_UNITS = 'seconds since 1970-01-01 00:00:00'
+CALENDAR = 'proleptic_gregorian'
+
+def axis_index(source,target):
+    """
+    Linear interpolation of one coordinate axis, from the source to the target coordinates
+    Returns (lower, upper, weight) so that a value at target[k] is
+        (1-weight[k])*values[lower[k]] + weight[k]*values[upper[k]]
+    Targets outside the source axis get lower = upper = -1 and a NaN weight
+    (i.e. the NaN fill of xarray's interp)
+    """
+    source = np.asarray(source,dtype=np.float64)
+    target = np.asarray(target,dtype=np.float64)
+    order = np.argsort(source)
+    ascending = source[order]
+    n = len(ascending)
+    position = np.clip(np.searchsorted(ascending,target,side='right')-1,0,max(n-2,0))
+    lo = ascending[position]
+    hi = ascending[np.minimum(position+1,n-1)]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        weight = np.where(hi > lo,(target-lo)/(hi-lo),0.0)
+    lower = order[position]
+    upper = order[np.minimum(position+1,n-1)]
+    # The last source point is an exact hit too (its position is clipped to the interval before it)
+    last = target == ascending[-1]
+    lower[last] = order[-1]
+    weight[last] = 0.0
+    # Exact hits take only the lower value, so a NaN neighbour does not leak in
+    upper = np.where(weight == 0,lower,upper)
+    outside = (target < ascending[0]) | (target > ascending[-1])
+    lower[outside] = upper[outside] = -1
+    weight[outside] = np.nan
+    return lower, upper, weight
+
+def regrid_index(ds,lat,lon):
+    # Interpolation index from the grid of the scene ds to the (lat, lon) grid of the merged stack
+    return axis_index(ds.lat.values,lat), axis_index(ds.lon.values,lon)
+
+def regrid(array,index):
+    """
+    Bilinear interpolation of a (lat, lon) array with an index from regrid_index
+    Equivalent to ds.interp(lat=LAT,lon=LON) with the weights worked out once per grid
+    """
+    (ilo,ihi,wi),(jlo,jhi,wj) = index
+    # Along lat, then along lon - points outside the scene are NaN
+    array = np.asarray(array,dtype=np.float64)
+    rows = (1-wi)[:,None]*array[ilo] + wi[:,None]*array[ihi]
+    out = (1-wj)*rows[:,jlo] + wj*rows[:,jhi]
+    out[np.isnan(wi),:] = np.nan
+    out[:,np.isnan(wj)] = np.nan
+    return out
+
+def grid_key(ds):
+    # Identifies the grid of a scene, so scenes on the same grid share one regrid index
+    return (ds.lat.values.tobytes(),ds.lon.values.tobytes())
+
+def create_stack(OUT,reference,chunk=CHUNK):
+    """
+    Creates an empty merged stack on the grid of the reference scene
+    height and coh are (t, lat, lon) with t unlimited, written one scene at a time
+    elevation, crs and the lat/lon attributes are copied from the reference
+    """
+    nc = netCDF4.Dataset(OUT,'w',format='NETCDF4')
+    lat, lon = reference.lat.values, reference.lon.values
+    nc.createDimension('t',None)
+    nc.createDimension('lat',len(lat))
+    nc.createDimension('lon',len(lon))
+    t = nc.createVariable('t','f8',('t',))
+    t.units, t.calendar, t.standard_name = TIME_UNITS, CALENDAR, 'time'
+    for name, values in [('lat',lat),('lon',lon)]:
+        var = nc.createVariable(name,values.dtype,(name,))
+        var.setncatts(reference[name].attrs)
+        var[:] = values
+    for name in STACKED:
+        var = nc.createVariable(name,'f4',('t','lat','lon'),zlib=True,complevel=4,
+                                chunksizes=chunk_sizes(lat,lon,chunk),fill_value=np.float32(np.nan))
+        var.setncatts({k:v for k,v in reference[STACKED[name]].attrs.items() if k != '_FillValue'})
+    if 'metadata' in reference:
+        var = nc.createVariable('metadata',reference.metadata.dtype,('t',))
+        var.setncatts(reference.metadata.attrs)
+    if 'crs' in reference:
+        var = nc.createVariable('crs',reference.crs.dtype,())
+        var.setncatts(reference.crs.attrs)
+        var.assignValue(reference.crs.values)
+    var = nc.createVariable('elevation','f4',('lat','lon'),zlib=True,complevel=4,
+                            chunksizes=chunk_sizes(lat,lon,chunk)[1:],fill_value=np.float32(np.nan))
+    var.setncatts({k:v for k,v in reference.elevation.attrs.items() if k != '_FillValue'})
+    var[:] = reference.elevation.values
+    return nc
 
-def get_pattern(filename):
-    p = filename.split('_')
-    p.pop(4)
-    return p
+def scene_time(record):
+    # Time of a scene as stored along t
+    return float(netCDF4.date2num(datetime.strptime(record['datetime'],'%Y%m%dT%H%M%S'),TIME_UNITS,CALENDAR))
 
-files = glob.glob('*.nc')
-parameter_groups = [list(X) for X in set(tuple(X) for X in [get_pattern(x) for x in files])]
+def append_scene(nc,record,indexes):
+    """
+    Regrids one scene onto the grid of the stack and writes it at the end of t
+    indexes caches the regrid index of each scene grid met so far
+    """
+    lat, lon = nc['lat'][:], nc['lon'][:]
+    with xr.open_dataset(record['path']) as ds:
+        key = grid_key(ds)
+        if key not in indexes:
+            indexes[key] = regrid_index(ds,lat,lon)
+        k = written(nc)
+        for name in STACKED:
+            nc[name][k,:,:] = regrid(ds[STACKED[name]].values,indexes[key]).astype(np.float32)
+        if 'metadata' in nc.variables and 'metadata' in ds:
+            nc['metadata'][k] = ds.metadata.values
+        # t last, so a scene interrupted while being written has no time and is appended again by update
+        nc['t'][k] = scene_time(record)
+
+def merged_name(group):
+    # File name of the merged time series of a group (see catalogue.GROUP)
+    return '_'.join(['TDX',
+                     'DEM',
+                     group['country'],
+                     group['mode'],
+                     group['orbit'],
+                     'ML'+str(group['looks'])])+'_merged.nc'
+
+def merge(records,OUT,group,con):
+    """
+    Merges the scenes of records (ordered by datetime) into a time series on the grid of the first
+    The stack is written one scene at a time, so only one scene is held in memory
+    It is built in a temporary file next to OUT, which only replaces OUT once it is complete
+    """
+    print('merging '+str(len(records))+' images')
+    fd, tmp = tempfile.mkstemp(suffix='.nc',dir=os.path.dirname(os.path.abspath(OUT)))
+    os.close(fd)
+    try:
+        with xr.open_dataset(records[0]['path']) as reference:
+            nc = create_stack(tmp,reference)
+        indexes = {}
+        try:
+            for record in records:
+                append_scene(nc,record,indexes)
+        finally:
+            nc.close()
+        os.replace(tmp,OUT)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    register_merged(con,OUT,group)
+
+def written(nc):
+    # Number of scenes of a stack written in full - a scene interrupted while being written has no time yet
+    return int(np.ma.count(nc['t'][:]))
+
+def stored_times(nc):
+    # Times of the scenes in a stack, as the datetime strings of the catalogue (whatever units they are stored in)
+    t = nc['t']
+    times = netCDF4.num2date(np.ma.compressed(t[:]),t.units,getattr(t,'calendar','standard'))
+    return [time.strftime('%Y%m%dT%H%M%S') for time in times]
+
+def appendable(nc):
+    # Whether scenes can be appended to a stack - only to those written by create_stack (older stacks
+    # were written by xarray, with a fixed t in units of their own)
+    t = nc['t']
+    return nc.dimensions['t'].isunlimited() and getattr(t,'units',None) == TIME_UNITS
+
+def update(records,OUT,group,con):
+    """
+    Adds the scenes of records that are missing from the existing stack OUT
+    Only the new scenes are read and regridded (onto the stored lat/lon) and written along t
+    If a new scene is older than the last one stored, or the stack cannot be appended to,
+    the stack is rebuilt instead (OUT is kept until the rebuilt stack replaces it)
+    """
+    rebuild = False
+    with netCDF4.Dataset(OUT,'r') as nc:
+        if not appendable(nc):
+            print(OUT+' was written in an older format')
+            rebuild = True
+        else:
+            stored = stored_times(nc)
+    if not rebuild:
+        new = [r for r in records if r['datetime'] not in set(stored)]
+        if len(new) == 0:
+            print(OUT+' is up to date')
+            return
+        # Datetime strings sort in time order
+        rebuild = len(stored) > 0 and new[0]['datetime'] < max(stored)
+        if rebuild:
+            print('new images predate '+OUT)
+    if rebuild:
+        print('rebuilding '+OUT)
+        merge(records,OUT,group,con)
+        return
+    print('appending '+str(len(new))+' images to '+OUT)
+    nc = netCDF4.Dataset(OUT,'a')
+    try:
+        indexes = {}
+        for record in new:
+            append_scene(nc,record,indexes)
+    finally:
+        nc.close()
+    register_merged(con,OUT,group)
+
+def register_merged(con,OUT,group):
+    # Adds a merged time series to the catalogue, so later steps can look up its group
+    record = dict(group,path=os.path.abspath(OUT),kind='merged',datetime=None,hoa=None,baseline=None,
+                  mtime=os.path.getmtime(OUT))
+    catalogue.register(con,record)
+    
+#------------------------------------------------------------------------
 
-for p in parameter_groups:
-    merge(p)
+def main():
+    parser = argparse.ArgumentParser(description='Merge the exported scenes of each group into a time series')
+    parser.add_argument('--rebuild',action='store_true',
+                        help='merge every group from scratch instead of appending new scenes')
+    args = parser.parse_args()
+    con = catalogue.connect()
+    catalogue.update(con,'.')
+    for group in catalogue.groups(con,folder='.',kind='netcdf'):
+        records = catalogue.query(con,folder='.',kind='netcdf',**group)
+        OUT = merged_name(group)
+        if os.path.exists(OUT) and not args.rebuild:
+            update(records,OUT,group,con)
+        else:
+            merge(records,OUT,group,con)
 
+if __name__ == '__main__':
+    main()
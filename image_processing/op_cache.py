@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+A cache of SNAP operator outputs, so re-runs that only change later (numpy) steps
+skip Multilook and Goldstein filtering.
+
+An output is keyed by the file behind its input product (path, modification time and size),
+the operator name and its sorted parameters. It is stored in BEAM-DIMAP in the cache directory,
+and read back from there whenever the same operator is run on the same input with the same parameters.
+Outputs read from the cache are themselves files, so a whole chain of operators is cached step by step.
+Inputs that only exist in memory (no file behind them) are never cached.
+
+The cache is used when the TANDEX_OP_CACHE environment variable names a directory
+(the scripts set it with --op-cache). Its size is kept under TANDEX_OP_CACHE_GB (default 50),
+by removing the least recently used outputs. Outputs used since the run started (TANDEX_OP_CACHE_RUN)
+may be being read by other workers, so they are never removed - the cache can go over its size
+until the next run.
+"""
+
+from snappy import ProductIO, GPF, HashMap
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import time
+
+# Operators worth caching - expensive, and run on unchanged inputs from one run to the next
+# (Interferogram and TopoPhaseRemoval are not: make_ifgs.py and remove_SRTM.py write their outputs anyway)
+CACHED_OPERATORS = ['Multilook','GoldsteinPhaseFiltering']
+
+# Start of the run, inherited by the workers it starts
+os.environ.setdefault('TANDEX_OP_CACHE_RUN',str(time.time()))
+
+DEFAULT_SIZE_GB = 50
+
+def cache_dir():
+    # The cache directory, or None when operator outputs are not cached
+    return os.environ.get('TANDEX_OP_CACHE')
+
+def cache_size():
+    # Maximum size of the cache in bytes
+    return float(os.environ.get('TANDEX_OP_CACHE_GB',DEFAULT_SIZE_GB))*2**30
+
+def source_file(product):
+    # Path of the file behind a product, or None for products that only exist in memory
+    location = product.getFileLocation()
+    if location is None:
+        return None
+    path = str(location.getAbsolutePath())
+    return path if os.path.isfile(path) else None
+
+def cache_key(function,params,source):
+    """
+    Key of an operator output - a hash of the input file's identity, the operator and its parameters
+    Returns None if the input has no file behind it
+    """
+    path = source_file(source)
+    if path is None:
+        return None
+    stat = os.stat(path)
+    identity = {'source':[path,stat.st_mtime_ns,stat.st_size],
+                'operator':function,
+                'params':sorted((str(k),str(v)) for k, v in params.items())}
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+def entry_file(key):
+    # Each output has a directory of its own, so it can be moved into place in one step
+    return os.path.join(cache_dir(),key,key+'.dim')
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(f,name)) for f, subfolders, files in os.walk(folder) for name in files)
+
+def run_start():
+    # Outputs used since this time may be in use by a worker of this run
+    return float(os.environ['TANDEX_OP_CACHE_RUN'])
+
+def evict(keep=None):
+    """
+    Removes the least recently used outputs until the cache fits in its size
+    Only outputs last used before the run started are removed (keep is never removed)
+    """
+    entries, total = [], 0
+    for entry in os.scandir(cache_dir()):
+        if entry.is_dir() and not entry.name.startswith('tmp'):
+            size = folder_size(entry.path)
+            total += size
+            if entry.name != keep and entry.stat().st_mtime < run_start():
+                entries.append((entry.stat().st_mtime,entry.path,size))
+    for mtime, path, size in sorted(entries):
+        if total <= cache_size():
+            break
+        shutil.rmtree(path,ignore_errors=True)
+        total -= size
+
+def store(key,result):
+    """
+    Writes an operator output into the cache
+    It is written to a temporary directory first and then renamed, so other workers
+    never read a partial output (if two workers store the same output, the first one is kept)
+    """
+    temp = tempfile.mkdtemp(prefix='tmp',dir=cache_dir())
+    try:
+        ProductIO.writeProduct(result,os.path.join(temp,key+'.dim'),'BEAM-DIMAP')
+        os.rename(temp,os.path.join(cache_dir(),key))
+    except OSError:
+        if not os.path.exists(entry_file(key)):
+            raise
+    finally:
+        shutil.rmtree(temp,ignore_errors=True)
+    evict(keep=key)
+
+def create_product(function,params,source):
+    """
+    GPF.createProduct(function, params, source), through the cache when it is on
+    params is a dict of operator parameters
+    """
+    p = HashMap()
+    for arg in params:
+        p.put(arg,params.get(arg))
+    key = None
+    if cache_dir() is not None and function in CACHED_OPERATORS:
+        key = cache_key(function,params,source)
+    if key is None:
+        return GPF.createProduct(function,p,source)
+    if not os.path.exists(entry_file(key)):
+        store(key,GPF.createProduct(function,p,source))
+    # Marks the output as recently used
+    os.utime(os.path.dirname(entry_file(key)))
+    return ProductIO.readProduct(entry_file(key))
+
+def add_arguments(parser):
+    # Adds the --op-cache options to a script's argument parser
+    parser.add_argument('--op-cache',default=cache_dir(),
+                        help='directory for caching SNAP operator outputs between runs')
+    parser.add_argument('--op-cache-gb',type=float,default=cache_size()/2**30,
+                        help='maximum size of the operator cache in GB')
+
+def configure(op_cache,op_cache_gb=DEFAULT_SIZE_GB):
+    # Turns the cache on for this process and the workers it starts
+    if op_cache is not None:
+        os.makedirs(op_cache,exist_ok=True)
+        os.environ['TANDEX_OP_CACHE'] = os.path.abspath(op_cache)
+        os.environ['TANDEX_OP_CACHE_GB'] = str(op_cache_gb)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Single-pass processing from TDX COSSC images to terrain-corrected phase height.
+
+Chains the work of make_ifgs.py, remove_SRTM.py and make_DEMs.py in one process per scene:
+    Interferogram -> TopoPhaseRemoval -> Multilook -> Goldstein -> numpy height -> Terrain-Correction
+The operators are kept in memory, so only the final products are written.
+With several look counts, the topographic phase removed interferogram is written once to --scratch
+(and removed when the scene is done), so every look count starts from it rather than running
+Interferogram and TopoPhaseRemoval again.
+With --op-cache, Multilook and Goldstein outputs are cached (see op_cache.py) - only those of inputs
+kept on disk between runs are found again, so it is make_DEMs.py re-runs that start from them.
+Pass --debug-dir to also write the intermediate products there.
+
+Takes a text file where each line is the path to a TDX COSSC image (as for make_ifgs.py)
+and one or more numbers of range looks:
+    $python pipeline.py <cossc_list> 3 8 16 -j 4
+Outputs are named as if the scripts had been run one after the other, e.g.
+    TDX_IFG_GAB_HS_20200101T000000_noSRTM_ML_3_height_TC.dim
+"""
+
+from snappy import ProductIO
+import os
+import argparse
+import shutil
+import tempfile
+import traceback
+from make_ifgs import ifg_file, interferogram, STORAGE_DIR, OUT_FOLDER
+from remove_SRTM import topo_phase_removal
+from make_DEMs import productToHeight, output_file, read_product
+import instrument
+import op_cache
+import workers
+import dem
+from sites import site_code
+from instrument import stage, scene
+
+def checkpoint(image,debug_dir,name):
+    # Writes an intermediate product to debug_dir and carries on from the written copy
+    # Without a debug_dir the product is passed on untouched, in memory
+    if debug_dir is None:
+        return image
+    target = os.path.join(debug_dir,name)
+    with stage(name+' (write)',product=image):
+        ProductIO.writeProduct(image,target,'BEAM-DIMAP')
+    return ProductIO.readProduct(target)
+
+def scene_outputs(cossc,looks,out_folder):
+    # Names of the height products made from one COSSC image
+    name = os.path.basename(ifg_file(cossc)).split('.dim')[0] + '_noSRTM.dim'
+    return [output_file(os.path.join(out_folder,name),L) for L in looks]
+
+def process(cossc,looks,out_folder,debug_dir=None,kz_cache=None,scratch=None):
+    """
+    Processes one COSSC image to a terrain-corrected height product for each number of looks
+    With debug_dir, the interferogram, the topographic phase removed interferogram and
+    the temporary products of each look count are written there
+    Otherwise, with several look counts, the topographic phase removed interferogram is written
+    to a temporary directory in scratch (default: out_folder)
+    """
+    name = os.path.basename(ifg_file(cossc))
+    if debug_dir is not None:
+        debug_dir = os.path.join(debug_dir,name.split('.dim')[0])
+        os.makedirs(debug_dir,exist_ok=True)
+    image = read_product(cossc)
+    image = checkpoint(interferogram(image),debug_dir,name)
+    image = checkpoint(topo_phase_removal(image,site_code(name)),debug_dir,name.split('.dim')[0]+'_noSRTM.dim')
+    temp = None
+    if debug_dir is None and len(looks) > 1:
+        # Each look count would otherwise pull the lazy operators through Multilook again
+        temp = tempfile.mkdtemp(prefix='pipeline_',dir=out_folder if scratch is None else scratch)
+        image = checkpoint(image,temp,name.split('.dim')[0]+'_noSRTM.dim')
+    try:
+        for L, OUT in zip(looks,scene_outputs(cossc,looks,out_folder)):
+            if debug_dir is None:
+                productToHeight(image,L,OUT,in_memory=True,kz_cache=kz_cache)
+            else:
+                workdir = os.path.join(debug_dir,'ML_'+str(L))
+                os.makedirs(workdir,exist_ok=True)
+                productToHeight(image,L,OUT,workdir=workdir,kz_cache=kz_cache)
+    finally:
+        if temp is not None:
+            image.dispose()
+            shutil.rmtree(temp,ignore_errors=True)
+
+def process_task(task):
+    # Worker for the scene pool - returns (cossc, error) where error is None on success
+    cossc, looks, out_folder, debug_dir, kz_cache, scratch = task
+    try:
+        with scene(cossc):
+            process(cossc,looks,out_folder,debug_dir,kz_cache,scratch)
+        return cossc, None
+    except Exception:
+        error = traceback.format_exc()
+        print(error)
+        return cossc, error
+
+# Here is the main program----------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='COSSC to terrain-corrected phase height in one pass')
+    parser.add_argument('cossc_list',help='text file where each line is the path to a TDX COSSC image')
+    parser.add_argument('NLOOKS',type=int,nargs='+',help='number(s) of range looks')
+    workers.add_argument(parser)
+    parser.add_argument('--out-folder',default=OUT_FOLDER,help='where the height products are written')
+    parser.add_argument('--debug-dir',default=None,help='write intermediate products here')
+    parser.add_argument('--scratch',default=None,
+                        help='where the interferogram shared by several look counts is written for the scene '
+                             '(default: the out folder)')
+    parser.add_argument('--kz-cache',default=None,
+                        help='directory for caching the scene geometry used to compute kz')
+    instrument.add_argument(parser)
+    op_cache.add_arguments(parser)
+    dem.add_argument(parser)
+    args = parser.parse_args()
+    instrument.configure(args.stage_log)
+    op_cache.configure(args.op_cache,args.op_cache_gb)
+    dem.configure(args.dem_dir)
+
+    with open(args.cossc_list,'r') as file:
+        COSSC_list = [os.path.join(STORAGE_DIR,line.rstrip('\n')[2:]) for line in file if line.strip()]
+    # Scenes with every output already written are skipped
+    todo = [c for c in COSSC_list
+            if not all(os.path.exists(f) for f in scene_outputs(c,args.NLOOKS,args.out_folder))]
+    tasks = [(c,args.NLOOKS,args.out_folder,args.debug_dir,args.kz_cache,args.scratch) for c in todo]
+    N = len(tasks)
+    print('Processing '+str(N)+' TDX images ('+str(len(COSSC_list)-N)+' already done)')
+
+    failed = []
+    i = 1
+    for cossc, error in workers.run(process_task,tasks,args.workers):
+        print('***')
+        print(str(i)+' of '+str(N)+': '+('Done' if error is None else 'UNSUCCESSFUL'))
+        print(cossc)
+        if error is not None:
+            failed.append(cossc)
+        i += 1
+    workers.summary(N,failed)
+    instrument.finish()
+
+if __name__ == '__main__':
+    main()
@@ -6,26 +6,57 @@ Created on Mon Apr 26 13:54:35 2021
 
 Call this script in folder containing interferograms (with flat earth but not topographic phase removed)
 It will simply save a copy of each interferogram with SRTM phase removed
+(using the local DEM of the site if one is given with --dem-dir - see dem.py)
 
 """
 
-from snappy import ProductIO, HashMap, GPF
+from snappy import ProductIO
 import glob
+import os
+import argparse
+import instrument
+import op_cache
+import dem
+from dem import dem_parameters
+from sites import site_code
+from instrument import stage, scene
+from op_cache import create_product
+
+def topo_phase_removal(image,site=None):
+    # TopoPhaseRemoval operator on an open product - the result stays in memory
+    # (unless the operator cache is on - see op_cache.py)
+    # The local DEM of the site is used if there is one (see dem.py)
+    return create_product('TopoPhaseRemoval',dem_parameters(site),image)
 
 def topo_removal(file):
-    image = ProductIO.readProduct(file)
-    p = HashMap()
-    p.put('demName','SRTM 1Sec HGT')
-    result = GPF.createProduct('TopoPhaseRemoval',p,image)
+    with stage('read') as info:
+        image = info['product'] = ProductIO.readProduct(file)
+    result = topo_phase_removal(image,site_code(os.path.basename(file)))
     # Write to temporary file
     outfile = file.split('.dim')[0] + '_noSRTM.dim'
-    ProductIO.writeProduct(result,outfile,'BEAM-DIMAP')
-    
-files = glob.glob('TDX_IFG*.dim')
+    # TopoPhaseRemoval is lazy - its work is done by the write
+    with stage('TopoPhaseRemoval (write)',product=result):
+        ProductIO.writeProduct(result,outfile,'BEAM-DIMAP')
 
-for file in files:
-    print('Topographic Removal: ',file)
-    print('********')
-    topo_removal(file)
+def main():
+    parser = argparse.ArgumentParser(description='Remove the SRTM topographic phase from interferograms')
+    instrument.add_argument(parser)
+    op_cache.add_arguments(parser)
+    dem.add_argument(parser)
+    args = parser.parse_args()
+    instrument.configure(args.stage_log)
+    op_cache.configure(args.op_cache,args.op_cache_gb)
+    dem.configure(args.dem_dir)
+    files = glob.glob('TDX_IFG*.dim')
     
-print('Done')
\ No newline at end of file
+    for file in files:
+        print('Topographic Removal: ',file)
+        print('********')
+        with scene(file):
+            topo_removal(file)
+        
+    print('Done')
+    instrument.finish()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+Study site definitions shared by the processing scripts
+Sites are keyed by the country code used in file names (GAB / PER)
+
+core_plots : polygon (lon, lat) around the core plots - a scene must cover this to be useful
+aoi : box (lat1, lat2, lon1, lon2) cut out of each product by subset.py
+"""
+
+SITES = {
+    'GAB': {'country': 'Gabon',
+            'core_plots': [(12.24885799008746368, -0.14350824099999146),
+                           (12.24885110630293283, -0.14259615803456555),
+                           (12.24975595848531107, -0.14259626696242139),
+                           (12.24975584715663501, -0.14353065658873754),
+                           (12.24885799008746368, -0.14350824099999146)],
+            'aoi': {'lat1':-0.12785363430965335,'lat2':-0.16050013350314909,
+                    'lon1':12.24259248791666899,'lon2':12.30306056704971596}},
+    'PER': {'country': 'Peru',
+            'core_plots': [(-69.72334001018973026, -11.0329910794429793),
+                           (-69.72334358246895647, -11.03207312025939579),
+                           (-69.72240573287906784, -11.0320753572009469),
+                           (-69.7224080470953993, -11.03302282454907512),
+                           (-69.72334001018973026, -11.0329910794429793)],
+            'aoi': {'lat1':-11.01584634449108258,'lat2':-11.04157027686576065,
+                    'lon1':-69.73351247478349535,'lon2':-69.7027921931213541}}
+    }
+
+def site_code(file):
+    # Site code from a file name, or None if there isn't one
+    for code in SITES:
+        if code in file:
+            return code
+    return None
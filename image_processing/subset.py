@@ -6,28 +6,115 @@ Created on Fri Apr  9 09:25:07 2021
 
 A simple operation to spatially subset net CDF files.
 Saves a subsetted copy of each .nc file with _subset appended to its name.
+The site of each file is taken from the scene catalogue (see catalogue.py).
+
+Only the lat/lon window of the area of interest (AOI) is read from each file.
+The window is worked out once per grid, and files are processed in parallel.
+Subsets that are newer than their input are not made again.
+
+By default, the AOI of each file is the one of its site in sites.py. Alternatively:
+    --aoi <json>        a file of AOIs by site code, e.g. {"GAB": {"lat1":..,"lat2":..,"lon1":..,"lon2":..}}
+    --shapefile <shp>   the bounding box of a shapefile, used for every file
+$python subset.py [files] -j 4
 """
 
 import xarray as xr
+import numpy as np
 import glob
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import catalogue
+from export_chunked import encoding, reset_layout
+from sites import SITES, site_code
+
+# Index windows of the grids met so far (per process)
+WINDOWS = {}
 
-files = glob.glob('*.nc')
+def shapefile_aoi(shapefile):
+    # Bounding box of all the shapes in a shapefile, in lat/lon
+    import geopandas as gpd
+    lon1, lat1, lon2, lat2 = gpd.read_file(shapefile).to_crs('EPSG:4326').total_bounds
+    return {'lat1':lat2,'lat2':lat1,'lon1':lon1,'lon2':lon2}
 
-gabon = {'lat1':-0.12785363430965335,'lat2':-0.16050013350314909,'lon1':12.24259248791666899,'lon2':12.30306056704971596}
-peru = {'lat1':-11.01584634449108258,'lat2':-11.04157027686576065,'lon1':-69.73351247478349535,'lon2':-69.7027921931213541}
+def index_range(coord,a,b):
+    # Slice of the coordinates that lie between a and b (inclusive, in either order), or None
+    inside = np.nonzero((coord >= min(a,b)) & (coord <= max(a,b)))[0]
+    if len(inside) == 0:
+        return None
+    return slice(int(inside[0]),int(inside[-1])+1)
 
-for f in files:
-    
-    target = f.split('.nc')[0] + '_subset.nc'
-    
-    if 'GAB' in f:
-        aoi = gabon
-    elif 'PER' in f:
-        aoi = peru
-        
+def window(ds,aoi):
+    # (lat, lon) index slices of aoi in the grid of ds, or None if they do not overlap
+    lat, lon = ds.lat.values, ds.lon.values
+    key = (lat.tobytes(),lon.tobytes(),tuple(sorted(aoi.items())))
+    if key not in WINDOWS:
+        LAT = index_range(lat,aoi['lat1'],aoi['lat2'])
+        LON = index_range(lon,aoi['lon1'],aoi['lon2'])
+        WINDOWS[key] = None if LAT is None or LON is None else (LAT,LON)
+    return WINDOWS[key]
+
+def subset(task):
+    # Writes the AOI window of one file - returns (file, message)
+    f, target, aoi = task
     with xr.open_dataset(f) as ds:
-        LAT = slice(aoi.get('lat1'),aoi.get('lat2'))
-        LON = slice(aoi.get('lon1'),aoi.get('lon2'))
-        ds = ds.sel(lat=LAT, lon=LON)
-        ds.to_netcdf(target)
-        
\ No newline at end of file
+        w = window(ds,aoi)
+        if w is None:
+            return f, 'does not overlap the AOI'
+        # Lazy - only the window is read from disk
+        ds = ds.isel(lat=w[0],lon=w[1])
+        reset_layout(ds)
+        ds.to_netcdf(target,format='NETCDF4',encoding=encoding(ds))
+    return f, 'subset to '+target
+
+def up_to_date(f,target):
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(f)
+
+# Here is the main program----------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='Spatially subset net CDF files to an area of interest')
+    parser.add_argument('files',nargs='*',help='net CDF files (default: every .nc file in this folder)')
+    parser.add_argument('--aoi',default=None,help='JSON file of AOIs by site code')
+    parser.add_argument('--shapefile',default=None,help='subset every file to the bounds of this shapefile')
+    parser.add_argument('-j','--workers',type=int,default=1,help='number of files subset at once')
+    args = parser.parse_args()
+
+    files = args.files or glob.glob('*.nc')
+    files = [f for f in files if not f.endswith('_subset.nc')]
+    if args.aoi is not None:
+        with open(args.aoi) as file:
+            aois = json.load(file)
+    else:
+        aois = {code:SITES[code]['aoi'] for code in SITES}
+    shape = shapefile_aoi(args.shapefile) if args.shapefile is not None else None
+
+    con = catalogue.connect()
+    tasks = []
+    for f in files:
+        target = f.split('.nc')[0] + '_subset.nc'
+        if up_to_date(f,target):
+            continue
+        if shape is not None:
+            tasks.append((f,target,shape))
+            continue
+        # Files that have not been catalogued fall back to the name
+        record = catalogue.lookup(con,f)
+        code = record['country'] if record is not None else site_code(f)
+        if code not in aois:
+            print('No AOI for '+f)
+            continue
+        tasks.append((f,target,aois[code]))
+    print('Subsetting '+str(len(tasks))+' files ('+str(len(files)-len(tasks))+' skipped)')
+
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers) as pool:
+            results = list(pool.map(subset,tasks))
+    else:
+        results = [subset(t) for t in tasks]
+    for f, message in results:
+        print(f+': '+message)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 2026
+
+@author: Harry Carstairs
+
+The worker pool shared by the SNAP scripts (make_ifgs.py, make_DEMs.py and pipeline.py):
+each task is run in a worker process of its own, and the scripts report on the results as they come.
+
+    for result in workers.run(process_task,tasks,args.workers):
+        ...
+    workers.summary(N,failed)
+"""
+
+import multiprocessing
+
+def add_argument(parser,what='scenes'):
+    # Adds the -j/--workers option to a script's argument parser
+    parser.add_argument('-j','--workers',type=int,default=1,
+                        help='number of '+what+' processed at once (each worker starts its own JVM)')
+
+def run(function,tasks,workers=1):
+    """
+    Yields function(task) for every task, in the order they finish
+    With one worker the tasks are run in this process, one after the other
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+    # 'spawn' rather than 'fork' - the JVM behind snappy does not survive a fork
+    pool = multiprocessing.get_context('spawn').Pool(workers)
+    try:
+        for result in pool.imap_unordered(function,tasks):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def summary(N,failed):
+    # Prints how many of the N tasks succeeded, and the ones that failed (as strings)
+    print('*************')
+    print(str(N-len(failed))+' of '+str(N)+' succeeded')
+    for task in failed:
+        print('FAILED: '+task)
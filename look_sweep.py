@@ -0,0 +1,100 @@
+"""
+Author : Harry Carstairs
+
+Change statistics for several numbers of range looks at once (the look count sensitivity study)
+
+Every look count is put on one shared grid (e.g. that of ML3), so the change maps of all look counts
+are found together, as one (looks, lat, lon) array, and the plot statistics of all of them
+in one pass with zonal.plot_stats:
+
+    stack = look_stack({L: [open_ds(f_gabA,L), open_ds(f_gabD,L)] for L in looks}, reference)
+    change = change_maps(stack, before=[0,1,2,3], after=[4,5,6,7])
+    plots = pd.concat([shps, shps_bg])    # the index needs the logged (GC) and the control (GB) plots
+    index = plot_index(plots, reference.lat, reference.lon, all_touched=True)
+    df_stats = sweep_stats(change, index, logged, control, dagb)
+
+"""
+
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import stats
+from zonal import plot_stats
+
+def look_stack(stacks,reference,var='height'):
+    """
+    Stacks the time series of several look counts on the grid of reference
+
+    Parameters
+    ----------
+    stacks : dict
+        {looks: list of Datasets} - e.g. the ascending and descending time series of each look count
+        Each Dataset is put on the grid of reference before those of a look count are concatenated
+        along t and sorted by time (so passes on different grids do not mask each other with NaNs)
+    reference : Dataset or DataArray
+        its lat and lon are the shared grid (other look counts are nearest-neighbour interpolated)
+    var : str
+        variable to stack
+
+    Returns
+    -------
+    stack : (looks, t, lat, lon) DataArray
+        (t is taken from the first look count - every look count must have the same number of dates)
+    """
+    looks = sorted(stacks)
+    layers = []
+    for L in looks:
+        regridded = [ds[var].interp(lat=reference.lat,lon=reference.lon,method='nearest') for ds in stacks[L]]
+        layers.append(xr.concat(regridded,dim='t').sortby('t'))
+    return xr.concat(layers,dim=pd.Index(looks,name='looks'),join='override')
+
+def change_maps(stack,before,after):
+    """
+    Change between the mean of the dates before and after, for every look count
+
+    Parameters
+    ----------
+    stack : (looks, t, lat, lon) DataArray from look_stack
+    before, after : lists of t positions (as with isel)
+
+    Returns
+    -------
+    change : (looks, lat, lon) DataArray, relative to the mean change of each look count
+    """
+    change = stack.isel(t=after).mean(dim='t') - stack.isel(t=before).mean(dim='t')
+    return change - change.mean(dim=['lat','lon'])
+
+def sweep_stats(change,index,logged,control,dagb):
+    """
+    Sensitivity of phase height change to AGB loss, for every look count
+
+    Parameters
+    ----------
+    change : (looks, lat, lon) DataArray from change_maps
+    index : dict from zonal.plot_index, on the grid of change
+    logged : list of names of the selectively logged plots (e.g. GC1-GC4)
+    control : list of names of the control plots (e.g. GB1-GB11)
+    dagb : dict or Series of the AGB change of each logged plot
+
+    Returns
+    -------
+    df_stats : DataFrame with one row per look count
+        looks, slope, r, p, se (of the best fit line of plot change against AGB change)
+        and control_std (std dev of the change in the control plots)
+    """
+    means = plot_stats(change,index)['mean']
+    names = list(index['names'])
+    DH = means[:,[names.index(p) for p in logged]]
+    controls = means[:,[names.index(p) for p in control]]
+    DAGB = np.array([dagb[p] for p in logged])
+    rows = []
+    for k, L in enumerate(change['looks'].values):
+        slope, intercept, r, p, se = stats.linregress(DAGB,DH[k])
+        rows.append({'looks':L,
+                     'slope':slope,
+                     'r':r,
+                     'p':p,
+                     'se':se,
+                     'control_std':controls[k].std()})
+    return pd.DataFrame(rows)
@@ -0,0 +1,156 @@
+"""
+Author : Harry Carstairs
+
+Local incidence angles of the ascending (A) and descending (D) passes, worked out from the terrain
+
+Slope and aspect come from the SRTM elevation saved with every scene by Terrain-Correction
+(the elevation variable of the merged stacks), so the angles are on the grid of the stack:
+
+    geometry = pass_geometry(ascending.elevation)
+    change_ds = pass_selection(ascending, descending, geometry.angleA, geometry.angleD)
+
+A slope S facing aspect a (downslope direction, degrees clockwise from north), seen at incidence angle
+theta0 by a radar looking towards azimuth phi (heading + 90, right looking), has
+    cos(theta_i) = cos(S)cos(theta0) - sin(S)sin(theta0)cos(a - phi)
+so slopes facing the sensor (a = phi + 180) are seen at theta0 - S, and slopes facing away at theta0 + S.
+The projected angle (as SNAP's projectedLocalIncidenceAngle) only counts the slope across the range direction.
+The preferred pass is the one with the larger angle (the one that sees the slope least foreshortened).
+
+worst_aspect gives, for any slopes, the aspect at which the better of the two passes is worst off,
+and its angle, in closed form (as min_aspect and min_angle of pass_dir_analysis.ipynb, without sampling aspects).
+It differs from the notebook in two ways:
+    aspect - the notebook's theta0 - S cos(a - phi) has slopes facing the sensor at a = phi, so its aspect is
+             the upslope direction, 180 degrees from the downslope aspect here (its min_aspect is ours + 180)
+    angle  - the notebook's form is first order in S, and underestimates the angle more the steeper the slope:
+             by 0.1 degrees at S = 5, 0.9 at 10, 2.5 at 15, 4.5 at 20, 6.9 at 25 and 10 at 30 (Gabon passes)
+
+"""
+
+
+import numpy as np
+import xarray as xr
+
+# Heading and incidence angle (degrees) of the Gabon passes
+PASSES = {'A':{'heading':349.4,'incidence':33.0},
+          'D':{'heading':192.0,'incidence':41.0}}
+
+# Mean radius of the Earth (m), for the pixel spacing of a lat/lon grid
+EARTH_RADIUS = 6371000.0
+
+def look_azimuth(heading):
+    # Azimuth of the look direction of a right-looking radar (degrees)
+    return (heading + 90) % 360
+
+def slope_aspect(elevation,lat,lon):
+    """
+    Slope (degrees from horizontal) and aspect (downslope direction, degrees clockwise from north)
+    of an elevation array (lat x lon) on a regular lat/lon grid
+    The aspect of flat pixels is meaningless (their slope is 0), and pixels next to NaNs are NaN
+    """
+    elevation = np.asarray(elevation,dtype=np.float64)
+    lat, lon = np.asarray(lat,dtype=np.float64), np.asarray(lon,dtype=np.float64)
+    # Distances along each axis in metres (a degree of lon shrinks with cos(lat))
+    north = EARTH_RADIUS*np.deg2rad(lat)
+    dz_dlat, dz_dlon = np.gradient(elevation,north,np.deg2rad(lon))
+    dz_north = dz_dlat
+    dz_east = dz_dlon/(EARTH_RADIUS*np.cos(np.deg2rad(lat)))[:,None]
+    slope = np.rad2deg(np.arctan(np.hypot(dz_east,dz_north)))
+    aspect = np.rad2deg(np.arctan2(-dz_east,-dz_north)) % 360
+    return slope, aspect
+
+def local_incidence(slope,aspect,incidence,heading,projected=False):
+    """
+    Local incidence angle (degrees) of a pass, broadcast over arrays of slope, aspect and incidence
+
+    Parameters
+    ----------
+    slope, aspect : arrays (degrees), as from slope_aspect
+    incidence : float or array
+        incidence angle of the pass on a flat surface (degrees)
+    heading : float
+        heading of the pass (degrees clockwise from north)
+    projected : bool
+        only count the slope across the range direction (the slope along the azimuth is ignored)
+    """
+    S, a = np.deg2rad(slope), np.deg2rad(aspect)
+    theta0 = np.deg2rad(incidence)
+    facing = np.cos(a - np.deg2rad(look_azimuth(heading)))
+    if projected:
+        # Slope angle across range, negative when facing the sensor
+        return np.rad2deg(theta0 + np.arctan(np.tan(S)*facing))
+    cos_theta = np.cos(S)*np.cos(theta0) - np.sin(S)*np.sin(theta0)*facing
+    return np.rad2deg(np.arccos(np.clip(cos_theta,-1,1)))
+
+def worst_aspect(slope,passes=PASSES):
+    """
+    Aspect at which the larger of the two passes' local incidence angles is smallest, and that angle
+
+    The angle of each pass goes as cos(theta_i) = p - q cos(a - phi), so the smallest of the larger angles
+    is either at the aspect where one pass sees the slope head on (phi + 180), or where the two angles cross,
+    which is where R cos(a - psi) = pA - pD. All (up to four) candidates are tried at once.
+
+    Parameters
+    ----------
+    slope : float or array (degrees)
+    passes : dict of the two passes, as PASSES
+
+    Returns
+    -------
+    angle : smallest possible local incidence angle of the better pass (degrees)
+        (exact - larger than the notebook's first order min_angle on steep slopes, see above)
+    aspect : the (downslope) aspect where it occurs (degrees) - the notebook's min_aspect is this + 180
+    """
+    S = np.deg2rad(np.asarray(slope,dtype=np.float64))
+    (A, D) = passes.values()
+    terms = []
+    for p in (A, D):
+        theta0 = np.deg2rad(p['incidence'])
+        terms.append((np.cos(S)*np.cos(theta0),np.sin(S)*np.sin(theta0),np.deg2rad(look_azimuth(p['heading']))))
+    (pA,qA,phiA), (pD,qD,phiD) = terms
+    # Crossings: qA cos(a - phiA) - qD cos(a - phiD) = pA - pD, written as R cos(a - psi)
+    X = qA*np.cos(phiA) - qD*np.cos(phiD)
+    Y = qA*np.sin(phiA) - qD*np.sin(phiD)
+    R, psi = np.hypot(X,Y), np.arctan2(Y,X)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        delta = np.arccos((pA - pD)/R)
+    candidates = np.stack(np.broadcast_arrays(phiA + np.pi,phiD + np.pi,psi + delta,psi - delta))
+    cosA = pA - qA*np.cos(candidates - phiA)
+    cosD = pD - qD*np.cos(candidates - phiD)
+    # The larger angle is the smaller cosine; candidates that are not crossings are NaN
+    worse = np.fmin(cosA,cosD)
+    # NaN slopes have no candidate at all - they get NaN angle and aspect
+    undefined = np.isnan(worse).all(axis=0)
+    best = np.argmax(np.where(np.isnan(worse),-np.inf,worse),axis=0)
+    cos_theta = np.take_along_axis(worse,best[None],axis=0)[0]
+    aspect = np.take_along_axis(candidates,best[None],axis=0)[0]
+    cos_theta, aspect = np.where(undefined,np.nan,cos_theta), np.where(undefined,np.nan,aspect)
+    return np.rad2deg(np.arccos(np.clip(cos_theta,-1,1))), np.rad2deg(aspect) % 360
+
+def pass_geometry(elevation,passes=PASSES,projected=True):
+    """
+    Slope, aspect and local incidence angle of both passes over the grid of an elevation DataArray
+
+    Parameters
+    ----------
+    elevation : DataArray (lat, lon), e.g. the elevation variable of a merged stack
+    passes : dict {'A': {'heading':..., 'incidence':...}, 'D': {...}}
+        incidence may be a (lat x lon) array where it changes across the swath
+    projected : bool
+        projected angles (as the SNAP rasters pass_selection was tuned on), or true local angles
+
+    Returns
+    -------
+    geometry : Dataset with slope, aspect, angleA, angleD and preferred
+        (1 where A has the larger angle, -1 where D has, 0 where the angles are not defined)
+    """
+    slope, aspect = slope_aspect(elevation.values,elevation.lat,elevation.lon)
+    angles = {name:local_incidence(slope,aspect,p['incidence'],p['heading'],projected)
+              for name, p in passes.items()}
+    with np.errstate(invalid='ignore'):
+        preferred = np.where(angles['A'] > angles['D'],1,np.where(angles['D'] >= angles['A'],-1,0))
+    data_vars = {'slope':(('lat','lon'),slope),
+                 'aspect':(('lat','lon'),aspect),
+                 'angleA':(('lat','lon'),angles['A']),
+                 'angleD':(('lat','lon'),angles['D']),
+                 'preferred':(('lat','lon'),preferred.astype(np.int8))}
+    return xr.Dataset(data_vars=data_vars,coords={'lat':elevation.lat,'lon':elevation.lon})
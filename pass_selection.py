@@ -0,0 +1,143 @@
+"""
+Author : Harry Carstairs
+
+Change maps that combine ascending (A) and descending (D) passes, for every pass selection strategy at once
+
+The stacks are read once, in blocks of rows, to get the change and median coherence of each pass.
+Every strategy is then worked out from those 2D maps:
+    naive  - average of A and D
+    asc    - A only, where it is coherent
+    des    - D only, where it is coherent
+    coh    - the more coherent pass
+    inc    - the pass with the larger local incidence angle
+    smart  - the more coherent pass, or the pass with the larger angle where the angles differ by more than theta_crit
+Pixels where neither pass is coherent are masked (except for asc and des, which use their own pass only).
+
+    change_ds = pass_selection(ascending, descending, angleA, angleD, before=[1], after=[2])
+    coarse = coarsen_maps(change_ds, 16)    # 1 ha at ML3
+
+"""
+
+
+import numpy as np
+import xarray as xr
+import warnings
+
+STRATEGIES = ['naive','asc','des','coh','inc','smart']
+
+def pass_change(stack,before,after,block_rows=1024):
+    """
+    Change in height and median coherence of one pass, reading the stack in blocks of rows
+
+    Parameters
+    ----------
+    stack : Dataset with height and coh (t, lat, lon) - may be lazily loaded from file
+    before, after : lists of t positions (as with isel)
+    block_rows : int
+        number of rows read at a time
+
+    Returns
+    -------
+    change : (lat x lon) numpy array, mean height after - mean height before
+    coh : (lat x lon) numpy array, median coherence over t (NaNs skipped)
+    """
+    H, W = stack.sizes['lat'], stack.sizes['lon']
+    change = np.empty((H,W))
+    coh = np.empty((H,W))
+    for y0 in range(0,H,block_rows):
+        rows = slice(y0,min(y0+block_rows,H))
+        height = stack.height.isel(lat=rows).values
+        with warnings.catch_warnings():
+            # Pixels that are NaN at every date stay NaN
+            warnings.simplefilter('ignore',RuntimeWarning)
+            change[rows] = np.nanmean(height[after],axis=0) - np.nanmean(height[before],axis=0)
+            coh[rows] = np.nanmedian(stack.coh.isel(lat=rows).values,axis=0)
+    return change, coh
+
+def offset_removed(change,where):
+    # change minus its mean where `where` is True (the offset of one pass)
+    return change - np.nanmean(np.where(where,change,np.nan))
+
+def combine(changeA,changeD,whereA,neither,offsetD=None):
+    """
+    Takes A where whereA is True and D elsewhere, after removing the offset of each pass
+    offsetD is where the offset of D is measured (default: ~whereA)
+    """
+    offsetD = ~whereA if offsetD is None else offsetD
+    change = np.where(whereA,offset_removed(changeA,whereA),offset_removed(changeD,offsetD))
+    return np.where(neither,np.nan,change)
+
+def selection_maps(changeA,changeD,cohA,cohD,angleA=None,angleD=None,coh_min=0.4,theta_crit=20):
+    """
+    Change map of every pass selection strategy, from the per-pass maps (all 2D numpy arrays)
+    angleA, angleD are the local incidence angles - without them, inc and smart are not made
+    Returns a dict {strategy: 2D array}
+    """
+    with np.errstate(invalid='ignore'):
+        neither = (cohA < coh_min) & (cohD < coh_min)
+        moreA = cohA > cohD
+        maps = {}
+        naive = np.where(neither,np.nan,0.5*(changeA+changeD))
+        maps['naive'] = naive - np.nanmean(naive)
+        asc = np.where(cohA > coh_min,changeA,np.nan)
+        maps['asc'] = asc - np.nanmean(asc)
+        des = np.where(cohD > coh_min,changeD,np.nan)
+        maps['des'] = des - np.nanmean(des)
+        maps['coh'] = combine(changeA,changeD,moreA,neither)
+        if angleA is not None and angleD is not None:
+            steeperA = angleA > angleD
+            maps['inc'] = combine(changeA,changeD,steeperA,neither)
+            steep = np.fabs(angleA - angleD) > theta_crit
+            whereA = (moreA & ~steep) | (steeperA & steep)
+            maps['smart'] = combine(changeA,changeD,whereA,neither,offsetD=~(whereA|neither))
+    return maps
+
+def pass_selection(ascending,descending,angleA=None,angleD=None,before=[1],after=[2],
+                   coh_min=0.4,theta_crit=20,block_rows=1024):
+    """
+    Change maps of every pass selection strategy
+
+    Parameters
+    ----------
+    ascending, descending : Datasets with height and coh (t, lat, lon) on the same grid
+    angleA, angleD : DataArrays (lat, lon) of local incidence angle on that grid, optional
+    before, after : lists of t positions (as with isel), used for both passes
+    coh_min : float
+        a pass is coherent where its median coherence is above this
+    theta_crit : float
+        difference in incidence angle (degrees) above which the pass is chosen by angle
+    block_rows : int
+        number of rows of the stacks read at a time
+
+    Returns
+    -------
+    change_ds : Dataset with change_<strategy> for each strategy, and cohA, cohD
+    """
+    changeA, cohA = pass_change(ascending,before,after,block_rows)
+    changeD, cohD = pass_change(descending,before,after,block_rows)
+    angles = [None if a is None else np.asarray(a) for a in (angleA,angleD)]
+    maps = selection_maps(changeA,changeD,cohA,cohD,angles[0],angles[1],coh_min,theta_crit)
+    coords = {'lat':ascending.lat,'lon':ascending.lon}
+    data_vars = {'change_'+s:(('lat','lon'),maps[s]) for s in STRATEGIES if s in maps}
+    data_vars.update(cohA=(('lat','lon'),cohA),cohD=(('lat','lon'),cohD))
+    return xr.Dataset(data_vars=data_vars,coords=coords)
+
+def coarsen_maps(ds,factor=16,max_nan=50):
+    """
+    Block means of every map over factor x factor pixels (e.g. 16 for 1 ha at ML3)
+    Trailing rows and columns that do not fill a block are trimmed
+    Blocks with max_nan or more NaN pixels are NaN
+    Same as ds.coarsen(lat=factor,lon=factor,boundary='trim').mean(), masked by the NaN count
+    """
+    H, W = ds.sizes['lat']//factor, ds.sizes['lon']//factor
+    data_vars = {}
+    for name, da in ds.data_vars.items():
+        blocks = da.values[:H*factor,:W*factor].reshape(H,factor,W,factor)
+        n_nan = np.isnan(blocks).sum(axis=(1,3))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore',RuntimeWarning)
+            mean = np.nanmean(blocks,axis=(1,3))
+        data_vars[name] = (('lat','lon'),np.where(n_nan < max_nan,mean,np.nan))
+    coords = {'lat':ds.lat.values[:H*factor].reshape(H,factor).mean(axis=1),
+              'lon':ds.lon.values[:W*factor].reshape(W,factor).mean(axis=1)}
+    return xr.Dataset(data_vars=data_vars,coords=coords)
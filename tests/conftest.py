@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The analysis modules live at the top of the repository and the processing scripts in image_processing
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,ROOT)
+sys.path.insert(0,os.path.join(ROOT,'image_processing'))
@@ -0,0 +1,64 @@
+import numpy as np
+import netCDF4
+import pytest
+import correct_signs
+
+def stack(path,flipped,T=4,signal=5.0,seed=0,calendar='proleptic_gregorian'):
+    # A merged stack of T dates of one terrain signal plus noise, with the dates in flipped negated
+    rng = np.random.default_rng(seed)
+    base = signal*rng.standard_normal((300,200))
+    with netCDF4.Dataset(path,'w') as nc:
+        nc.createDimension('t',None)
+        nc.createDimension('lat',300)
+        nc.createDimension('lon',200)
+        t = nc.createVariable('t','f8',('t',))
+        t.units = 'seconds since 1970-01-01 00:00:00'
+        if calendar is not None:
+            t.calendar = calendar
+        height = nc.createVariable('height','f4',('t','lat','lon'),zlib=True,chunksizes=(1,128,128),
+                                   fill_value=np.float32(np.nan))
+        for k in range(T):
+            t[k] = 1.58e9 + k*30*86400
+            h = base + rng.standard_normal((300,200))
+            height[k] = -h if k in flipped else h
+    return base
+
+def read(path,name):
+    with netCDF4.Dataset(path) as nc:
+        return np.ma.filled(nc[name][:],np.nan)
+
+def test_flipped_dates_are_corrected_and_recorded(tmp_path):
+    path = str(tmp_path/'stack.nc')
+    base = stack(path,[1])
+    assert list(correct_signs.correct(path)) == [1]
+    assert all(np.corrcoef(h.ravel(),base.ravel())[0,1] > 0.9 for h in read(path,'height'))
+    assert list(read(path,correct_signs.SIGN)) == [1,1,1,1]
+    assert list(read(path,correct_signs.APPLIED)) == [1,-1,1,1]
+    # Nothing is left to correct, and the correction can be undone
+    assert list(correct_signs.correct(path)) == []
+    assert list(correct_signs.undo(path)) == [1]
+    assert np.corrcoef(read(path,'height')[1].ravel(),base.ravel())[0,1] < -0.9
+
+def test_even_split_needs_a_reference(tmp_path):
+    path = str(tmp_path/'stack.nc')
+    base = stack(path,[0,3])
+    before = read(path,'height')
+    with pytest.raises(ValueError):
+        correct_signs.correct(path)
+    np.testing.assert_array_equal(read(path,'height'),before)
+    # The second date is known to be right, so the first and last are flipped
+    assert list(correct_signs.correct(path,reference='2020-02-25')) == [0,3]
+    assert all(np.corrcoef(h.ravel(),base.ravel())[0,1] > 0.9 for h in read(path,'height'))
+
+def test_noise_is_left_alone(tmp_path):
+    path = str(tmp_path/'stack.nc')
+    stack(path,[],T=5,signal=0.0)
+    before = read(path,'height')
+    with pytest.raises(ValueError):
+        correct_signs.correct(path)
+    np.testing.assert_array_equal(read(path,'height'),before)
+
+def test_stacks_without_a_calendar_take_the_standard_one(tmp_path):
+    path = str(tmp_path/'stack.nc')
+    stack(path,[0,3],calendar=None)
+    assert list(correct_signs.correct(path,reference='2020-02-25')) == [0,3]
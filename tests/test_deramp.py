@@ -0,0 +1,41 @@
+import numpy as np
+from deramp import remove_plane, get_coeff, get_samples
+
+def with_holes(array,seed=0,fraction=0.1):
+    array = array.copy()
+    array[np.random.default_rng(seed).random(array.shape) < fraction] = np.nan
+    return array
+
+def test_exact_fit_recovers_a_plane():
+    x, y = np.mgrid[:300,:200].astype(float)
+    array = with_holes(0.02*x - 0.05*y + 3.0)
+    np.testing.assert_allclose(get_coeff(array,None),[0.02,-0.05,3.0],atol=1e-9)
+    residual = remove_plane(array)
+    assert np.nanmax(np.abs(residual)) < 1e-8
+    assert np.array_equal(np.isnan(residual),np.isnan(array))
+
+def test_exact_fit_recovers_a_quadratic_over_several_blocks():
+    x, y = np.mgrid[:2500,:40].astype(float)
+    p = [1e-6,-2e-5,3e-4,0.01,-0.02,5.0]
+    array = with_holes(p[0]*x**2 + p[1]*x*y + p[2]*y**2 + p[3]*x + p[4]*y + p[5])
+    np.testing.assert_allclose(get_coeff(array,None,order=2),p,rtol=1e-6,atol=1e-9)
+    assert np.nanmax(np.abs(remove_plane(array,order=2))) < 1e-6
+
+def test_sampling_with_nans_is_seeded():
+    x, y = np.mgrid[:100,:100].astype(float)
+    array = with_holes(x + y + np.random.default_rng(1).normal(0,1,x.shape),fraction=0.5)
+    A1, B1 = get_samples(array,500,seed=3)
+    A2, B2 = get_samples(array,500,seed=3)
+    # NaN samples are redrawn, from the same generator
+    assert len(B1) == 500 and not np.isnan(B1).any()
+    np.testing.assert_array_equal(A1,A2)
+    np.testing.assert_array_equal(B1,B2)
+    np.testing.assert_array_equal(remove_plane(array,500,seed=3),remove_plane(array,500,seed=3))
+    assert not np.array_equal(get_samples(array,500,seed=4)[1],B1)
+
+def test_inplace_subtracts_from_the_array_itself():
+    x, y = np.mgrid[:50,:60].astype(float)
+    array = 2*x + y
+    residual = remove_plane(array,inplace=True)
+    assert residual is array
+    assert np.abs(array).max() < 1e-8
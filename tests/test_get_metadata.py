@@ -0,0 +1,48 @@
+import os
+import pandas as pd
+import get_metadata
+
+def attrs(**values):
+    return ''.join('<MDATTR name="'+k+'">'+str(v)+'</MDATTR>' for k, v in values.items())
+
+def header(path,baseline,lon=12.2):
+    # A BEAM-DIMAP header with the metadata read by read_header
+    corners = {'first_near':(lon,-0.1),'first_far':(lon+0.1,-0.1),'last_far':(lon+0.1,-0.2),'last_near':(lon,-0.2)}
+    abstract = attrs(**{c+'_'+axis:v for c, (x,y) in corners.items() for axis, v in (('long',x),('lat',y))})
+    acquisition = ('<MDElem name="acquisitionMode">'+attrs(datatakeStartTime='2020-01-01T05:00:00.1',imagingMode='HS')
+                   +'<MDElem name="rangeBandwidthClass">'+attrs(rgBW='150')+'</MDElem></MDElem>'
+                   +'<MDElem name="acquisitionGeometry">'
+                   +attrs(effectiveBaseline=baseline,orbitDirection='ASCENDING',heightOfAmbiguity=-50.0)+'</MDElem>')
+    xml = ('<Dimap_Document><Dataset_Sources><MDElem name="metadata">'
+           '<MDElem name="Abstracted_Metadata">'+abstract+'</MDElem>'
+           '<MDElem name="CoSSC_Metadata"><MDElem name="cossc_product">'
+           '<MDElem name="commonAcquisitionInfo">'+acquisition+'</MDElem>'
+           '<MDElem name="commonSceneInfo"><MDElem name="sceneCenterCoord">'+attrs(incidenceAngle=35.0)+'</MDElem></MDElem>'
+           '</MDElem></MDElem></MDElem></Dataset_Sources></Dimap_Document>')
+    with open(path,'w') as file:
+        file.write(xml)
+
+def test_only_new_or_modified_headers_are_read_again(tmp_path,monkeypatch):
+    files = [str(tmp_path/('TDX_IFG_GAB_HS_2020010'+str(k)+'T050000.dim')) for k in range(1,4)]
+    for k, f in enumerate(files):
+        header(f,100.0+k)
+    first = get_metadata.build_table(files[:2],workers=2)
+    assert list(first.baseline) == [100.0,101.0]
+    assert list(first.covers_core_plots) == ['True','True']
+    # The table goes through metadata.csv between runs
+    first.to_csv(str(tmp_path/'metadata.csv'))
+    previous = pd.read_csv(str(tmp_path/'metadata.csv'),index_col=0)
+
+    read = []
+    read_header = get_metadata.read_header
+    def counting(file):
+        read.append(file)
+        return read_header(file)
+    monkeypatch.setattr(get_metadata,'read_header',counting)
+    header(files[0],200.0)
+    stat = os.stat(files[0])
+    os.utime(files[0],(stat.st_atime,stat.st_mtime+10))
+    table = get_metadata.build_table(files,previous,workers=2)
+    assert sorted(read) == [files[0],files[2]]
+    assert list(table.file) == files
+    assert list(table.baseline) == [200.0,101.0,102.0]
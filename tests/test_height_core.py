@@ -0,0 +1,37 @@
+import numpy as np
+from height_core import cost_fun, neighbour_pairs, jump_counts, unwrap
+
+def wrapped_phase(seed,shape=(60,80)):
+    # A ramp wrapped into (-pi, pi), with noise, NaNs and runs of equal values
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:shape[0],:shape[1]]
+    phase = np.angle(np.exp(1j*(0.15*x + 0.05*y + rng.normal(0,0.8,shape))))
+    phase[rng.random(shape) < 0.05] = np.nan
+    phase[10:14,:] = phase[10,0]
+    return phase.astype(np.float32).astype(np.float64)
+
+def test_jump_counts_match_cost_fun_within_the_window():
+    for seed in range(5):
+        phase = wrapped_phase(seed)
+        for centre in (-2.0,0.3,np.pi-0.1):
+            offsets = np.linspace(centre-0.2,centre+0.2,25)
+            lo, hi, outside = neighbour_pairs(phase,window=(offsets[0],offsets[-1]))
+            expected = [cost_fun(phase,offset) for offset in offsets]
+            assert list(jump_counts(lo,hi,offsets,outside=outside)) == expected
+            # Offsets that are values of the phase (ties) count as in cost_fun too
+            ties = np.unique(phase[~np.isnan(phase)])[[100,200]]
+            lo, hi, outside = neighbour_pairs(phase,window=(ties[0],ties[-1]))
+            assert list(jump_counts(lo,hi,ties,outside=outside)) == [cost_fun(phase,t) for t in ties]
+
+def test_window_only_drops_pairs_no_offset_can_fall_between():
+    phase = wrapped_phase(7)
+    offsets = np.linspace(0.8,1.2,25)
+    lo, hi, outside = neighbour_pairs(phase,window=(offsets[0],offsets[-1]))
+    all_lo, all_hi, none = neighbour_pairs(phase)
+    assert none == 0 and lo.dtype == np.float32
+    assert len(lo) < len(all_lo)
+    assert list(jump_counts(lo,hi,offsets,outside=outside)) == list(jump_counts(all_lo,all_hi,offsets))
+
+def test_unwrap_keeps_the_nans():
+    phase = wrapped_phase(3)
+    assert np.array_equal(np.isnan(unwrap(phase)),np.isnan(phase))
@@ -0,0 +1,49 @@
+import numpy as np
+import rasterio
+import rioxarray
+import geopandas as gpd
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from hilly import slope_histogram, percent_hilly, THRESHOLDS
+
+def slope_raster(path,seed=0):
+    # Slope90 (band 1) and forest fraction (band 2), with missing slopes and forest, and slopes on the thresholds
+    rng = np.random.default_rng(seed)
+    slope = rng.uniform(0,50,(120,90)).astype(np.float32)
+    slope[rng.random(slope.shape) < 0.1] = np.nan
+    slope[::7,::5] = rng.choice(THRESHOLDS,slope[::7,::5].shape)
+    forest = rng.random((120,90)).astype(np.float32)
+    forest[rng.random(forest.shape) < 0.1] = np.nan
+    profile = {'driver':'GTiff','height':120,'width':90,'count':2,'dtype':'float32',
+               'crs':'EPSG:4326','transform':from_origin(9.0,2.0,0.01,0.01)}
+    with rasterio.open(path,'w',**profile) as dst:
+        dst.write(slope,1)
+        dst.write(forest,2)
+
+def notebook_percent_hilly(slope_90,H):
+    # percent_hilly of Slope.ipynb
+    hilly = slope_90.sel(band=1) >= H
+    hilly_forest = (slope_90.sel(band=2) * hilly).sum()
+    not_hilly_forest = (slope_90.sel(band=2) * ~hilly).sum()
+    return float( 100 * hilly_forest / (hilly_forest + not_hilly_forest) )
+
+def test_percent_hilly_matches_the_notebook(tmp_path):
+    path = str(tmp_path/'slope90.tif')
+    slope_raster(path)
+    slope_90 = rioxarray.open_rasterio(path).load()
+    expected = [notebook_percent_hilly(slope_90,H) for H in THRESHOLDS]
+    for workers in (1,2):
+        result = percent_hilly(slope_histogram(path,rows=25,workers=workers))
+        # The notebook sums in float32, hilly in float64
+        np.testing.assert_allclose(result.loc['all'].values,expected,rtol=1e-6)
+
+def test_regions_match_the_notebook_on_their_pixels(tmp_path):
+    path = str(tmp_path/'slope90.tif')
+    slope_raster(path,seed=1)
+    slope_90 = rioxarray.open_rasterio(path).load()
+    regions = gpd.GeoDataFrame({'CONTINENT':['west','east']},
+                               geometry=[box(9.0,0.8,9.4,2.0),box(9.4,0.8,9.9,2.0)],crs='EPSG:4326')
+    result = percent_hilly(slope_histogram(path,regions=regions,name='CONTINENT',rows=25))
+    west = slope_90.where(slope_90.x < 9.4,drop=True)
+    np.testing.assert_allclose(result.loc['west'].values,
+                               [notebook_percent_hilly(west,H) for H in THRESHOLDS],rtol=1e-6)
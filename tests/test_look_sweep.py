@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from look_sweep import look_stack
+
+def pass_series(lat,lon,times,seed):
+    rng = np.random.default_rng(seed)
+    height = rng.standard_normal((len(times),len(lat),len(lon)))
+    return xr.Dataset({'height':(('t','lat','lon'),height)},coords={'t':times,'lat':lat,'lon':lon})
+
+def test_passes_on_offset_grids_are_regridded_before_concatenating():
+    lat, lon = np.linspace(0.5,0.0,51), np.linspace(11.0,11.5,51)
+    # The descending grid is offset by half a pixel from the ascending one
+    ascending = pass_series(lat,lon,pd.to_datetime(['2020-01-01','2020-03-01']),0)
+    descending = pass_series(lat-0.005,lon+0.005,pd.to_datetime(['2020-02-01','2020-04-01']),1)
+    stack = look_stack({3:[ascending,descending]},ascending)
+    assert stack.shape == (1,4,51,51)
+    assert list(stack.t.values) == sorted(stack.t.values)
+    # Only the edge the descending grid does not reach is missing
+    assert float(stack.isnull().mean()) < 0.05
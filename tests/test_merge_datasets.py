@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4
+import catalogue
+import merge_datasets
+
+GROUP = {'country':'GAB','mode':'HS','orbit':'ASCENDING','looks':3}
+
+def scene(folder,datetime,lat,lon,seed):
+    # An exported scene, as export_netcdf.py writes it, and its catalogue record
+    rng = np.random.default_rng(seed)
+    ds = xr.Dataset({'height_HH':(('lat','lon'),rng.standard_normal((len(lat),len(lon)))),
+                     'coh_HH':(('lat','lon'),rng.random((len(lat),len(lon)))),
+                     'elevation':(('lat','lon'),rng.random((len(lat),len(lon))))},
+                    coords={'lat':lat,'lon':lon})
+    path = str(folder/('TDX_DEM_GAB_HS_'+datetime+'_ASCENDING_ML3.nc'))
+    ds.to_netcdf(path)
+    return dict(GROUP,path=path,kind='netcdf',datetime=datetime,hoa=None,baseline=None,mtime=0.0)
+
+def baseline_stack(records,OUT):
+    # A merged stack as the first version of merge_datasets.py wrote it (xarray, fixed t, its own time units)
+    datasets = []
+    for r in records:
+        with xr.open_dataset(r['path']) as ds:
+            time = pd.to_datetime(r['datetime'],format='%Y%m%dT%H%M%S')
+            datasets.append(xr.Dataset({'height':ds.height_HH.expand_dims(t=[time]),
+                                        'coh':ds.coh_HH.expand_dims(t=[time])}).load())
+    DS = xr.merge(datasets)
+    DS['elevation'] = xr.open_dataset(records[0]['path']).elevation.load()
+    DS.to_netcdf(OUT)
+
+def test_update_rebuilds_a_baseline_format_stack(tmp_path):
+    lat, lon = np.linspace(0.5,0.0,20), np.linspace(11.0,11.5,30)
+    records = [scene(tmp_path,d,lat,lon,k) for k, d in
+               enumerate(['20200101T050000','20200201T050000','20200301T050000'])]
+    OUT = str(tmp_path/merge_datasets.merged_name(GROUP))
+    baseline_stack(records[:2],OUT)
+    with netCDF4.Dataset(OUT) as nc:
+        assert not merge_datasets.appendable(nc)
+    con = catalogue.connect(str(tmp_path/'catalogue.sqlite'))
+    merge_datasets.update(records,OUT,GROUP,con)
+    with netCDF4.Dataset(OUT) as nc:
+        assert merge_datasets.appendable(nc)
+        assert merge_datasets.stored_times(nc) == [r['datetime'] for r in records]
+    with xr.open_dataset(OUT) as ds, xr.open_dataset(records[2]['path']) as last:
+        np.testing.assert_allclose(ds.height.isel(t=2).values,last.height_HH.values,rtol=1e-6)
+
+def test_update_appends_new_scenes_only(tmp_path):
+    lat, lon = np.linspace(0.5,0.0,20), np.linspace(11.0,11.5,30)
+    records = [scene(tmp_path,d,lat,lon,k) for k, d in
+               enumerate(['20200101T050000','20200201T050000','20200301T050000'])]
+    OUT = str(tmp_path/merge_datasets.merged_name(GROUP))
+    con = catalogue.connect(str(tmp_path/'catalogue.sqlite'))
+    merge_datasets.merge(records[:2],OUT,GROUP,con)
+    merge_datasets.update(records,OUT,GROUP,con)
+    merge_datasets.update(records,OUT,GROUP,con)
+    with netCDF4.Dataset(OUT) as nc:
+        assert merge_datasets.stored_times(nc) == [r['datetime'] for r in records]
+
+def test_regrid_onto_its_own_grid_is_the_identity():
+    lat, lon = np.linspace(0.5,0.0,50), np.linspace(11.0,11.6,60)
+    rng = np.random.default_rng(0)
+    array = rng.standard_normal((50,60))
+    array[rng.random(array.shape) < 0.05] = np.nan
+    index = (merge_datasets.axis_index(lat,lat),merge_datasets.axis_index(lon,lon))
+    np.testing.assert_array_equal(merge_datasets.regrid(array,index),array)
+
+def test_update_rewrites_a_scene_interrupted_before_its_time_was_written(tmp_path):
+    lat, lon = np.linspace(0.5,0.0,20), np.linspace(11.0,11.5,30)
+    records = [scene(tmp_path,d,lat,lon,k) for k, d in
+               enumerate(['20200101T050000','20200201T050000','20200301T050000'])]
+    OUT = str(tmp_path/merge_datasets.merged_name(GROUP))
+    con = catalogue.connect(str(tmp_path/'catalogue.sqlite'))
+    merge_datasets.merge(records[:2],OUT,GROUP,con)
+    with netCDF4.Dataset(OUT,'a') as nc:
+        nc['height'][2,:,:] = np.zeros((20,30),dtype=np.float32)
+    with netCDF4.Dataset(OUT) as nc:
+        assert merge_datasets.stored_times(nc) == [r['datetime'] for r in records[:2]]
+    merge_datasets.update(records,OUT,GROUP,con)
+    with netCDF4.Dataset(OUT) as nc:
+        assert len(nc.dimensions['t']) == 3
+        assert merge_datasets.stored_times(nc) == [r['datetime'] for r in records]
+    assert [p.name for p in tmp_path.glob('*.nc') if p.name.startswith('tmp')] == []
+
+def test_failed_rebuild_keeps_the_existing_stack(tmp_path):
+    lat, lon = np.linspace(0.5,0.0,20), np.linspace(11.0,11.5,30)
+    records = [scene(tmp_path,d,lat,lon,k) for k, d in
+               enumerate(['20200101T050000','20200201T050000','20200301T050000'])]
+    OUT = str(tmp_path/merge_datasets.merged_name(GROUP))
+    con = catalogue.connect(str(tmp_path/'catalogue.sqlite'))
+    merge_datasets.merge(records[1:],OUT,GROUP,con)
+    # The older scene makes update rebuild, and its file is gone
+    records[0]['path'] = str(tmp_path/'missing.nc')
+    try:
+        merge_datasets.update(records,OUT,GROUP,con)
+    except (OSError, ValueError):
+        pass
+    else:
+        raise AssertionError('the rebuild should have failed')
+    with netCDF4.Dataset(OUT) as nc:
+        assert merge_datasets.stored_times(nc) == [r['datetime'] for r in records[1:]]
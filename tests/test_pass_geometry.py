@@ -0,0 +1,41 @@
+import numpy as np
+import pass_geometry
+
+# min_angle and min_aspect of pass_dir_analysis.ipynb (360 aspect samples, first order in the slope)
+# for slopes of 5, 15 and 25 degrees
+NOTEBOOK = {5:(36.44,305.8),15:(34.18,345.0),25:(32.31,351.0)}
+
+# How much the first order form underestimates the exact angle, as documented in pass_geometry
+FIRST_ORDER_ERROR = {5:0.1,15:2.5,25:6.9}
+
+def test_worst_aspect_against_the_notebook():
+    for S, (angle, aspect) in NOTEBOOK.items():
+        exact, downslope = pass_geometry.worst_aspect(S)
+        # The notebook's aspect is the upslope direction (its aspects are sampled about a degree apart,
+        # and its first order optimum sits a little away from the exact one)
+        assert abs((downslope + 180) % 360 - aspect) < 2.5
+        assert abs(exact - angle - FIRST_ORDER_ERROR[S]) < 0.1
+
+def test_worst_aspect_against_a_sweep_of_aspects():
+    aspects = np.linspace(0,360,36001)
+    slopes = np.array([1.0,5.0,15.0,25.0,40.0])
+    angle, aspect = pass_geometry.worst_aspect(slopes)
+    for S, a, at in zip(slopes,angle,aspect):
+        worst = np.maximum(*[pass_geometry.local_incidence(S,aspects,p['incidence'],p['heading'])
+                             for p in pass_geometry.PASSES.values()])
+        # The minimum is at a kink, so the sweep overshoots it by up to its step times the slope of the curves
+        assert -1e-9 < worst.min() - a < 1e-2
+        assert abs((at - aspects[worst.argmin()] + 180) % 360 - 180) < 0.05
+
+def test_slopes_facing_the_sensor():
+    A = pass_geometry.PASSES['A']
+    facing = (pass_geometry.look_azimuth(A['heading']) + 180) % 360
+    assert np.isclose(pass_geometry.local_incidence(10,facing,A['incidence'],A['heading']),A['incidence'] - 10)
+    assert np.isclose(pass_geometry.local_incidence(10,facing,A['incidence'],A['heading'],projected=True),
+                      A['incidence'] - 10)
+
+def test_nan_slopes_give_nan_and_leave_the_others_alone():
+    angle, aspect = pass_geometry.worst_aspect(np.array([[0,5],[10,np.nan]]))
+    assert np.isnan(angle[1,1]) and np.isnan(aspect[1,1])
+    assert np.isfinite(angle[:,0]).all() and np.isfinite(angle[0,1])
+    np.testing.assert_allclose(angle[0,1],pass_geometry.worst_aspect(5)[0])
@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import xarray as xr
+import subset
+from sites import SITES
+
+def scene(path,seed=0):
+    # An exported scene around the Gabon AOI (lat descending, lon ascending), with a time dimension
+    lat, lon = np.linspace(-0.1,-0.2,201), np.linspace(12.2,12.35,301)
+    rng = np.random.default_rng(seed)
+    ds = xr.Dataset({'height':(('t','lat','lon'),rng.standard_normal((2,201,301)).astype(np.float32)),
+                     'elevation':(('lat','lon'),rng.random((201,301)))},
+                    coords={'t':[0,1],'lat':lat,'lon':lon})
+    ds.to_netcdf(path)
+    return ds
+
+def baseline(ds,aoi):
+    # The selection of the first version of subset.py
+    return ds.sel(lat=slice(aoi['lat1'],aoi['lat2']),lon=slice(aoi['lon1'],aoi['lon2']))
+
+def test_subset_keeps_the_aoi_as_sel_did(tmp_path):
+    f, target = str(tmp_path/'scene.nc'), str(tmp_path/'scene_subset.nc')
+    ds = scene(f)
+    # The site AOI, and one whose bounds fall exactly on coordinates
+    for aoi in (SITES['GAB']['aoi'],{'lat1':-0.13,'lat2':-0.15,'lon1':12.25,'lon2':12.3}):
+        assert subset.subset((f,target,aoi)) == (f,'subset to '+target)
+        with xr.open_dataset(target) as result:
+            xr.testing.assert_identical(result.load(),baseline(ds,aoi))
+
+def test_aoi_bounds_may_come_in_either_order(tmp_path):
+    f, target = str(tmp_path/'scene.nc'), str(tmp_path/'scene_subset.nc')
+    ds = scene(f)
+    aoi = {'lat1':-0.1312,'lat2':-0.1487,'lon1':12.2513,'lon2':12.2988}
+    swapped = {'lat1':aoi['lat2'],'lat2':aoi['lat1'],'lon1':aoi['lon2'],'lon2':aoi['lon1']}
+    subset.subset((f,target,swapped))
+    with xr.open_dataset(target) as result:
+        xr.testing.assert_identical(result.load(),baseline(ds,aoi))
+
+def test_files_outside_the_aoi_are_not_written(tmp_path):
+    f, target = str(tmp_path/'scene.nc'), str(tmp_path/'scene_subset.nc')
+    scene(f)
+    aoi = SITES['PER']['aoi']
+    assert subset.subset((f,target,aoi)) == (f,'does not overlap the AOI')
+    assert not os.path.exists(target)
+    assert not subset.up_to_date(f,target)
@@ -0,0 +1,34 @@
+import numpy as np
+import xarray as xr
+import geopandas as gpd
+import rioxarray
+from shapely.geometry import Polygon, box
+from zonal import plot_index, plot_stats
+
+def grid_map(seed=0):
+    # A map on a descending lat / ascending lon grid, as the merged stacks, with some NaNs
+    lat, lon = np.linspace(0.3,0.0,61), np.linspace(11.0,11.4,81)
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal((61,81))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return xr.DataArray(values,coords={'lat':lat,'lon':lon},dims=('lat','lon'),name='height')
+
+def plots():
+    # Corners are off the pixel centres (a centre exactly on an edge may go either way, see zonal)
+    shapes = [box(11.0512,0.0507,11.1212,0.1107),
+              Polygon([(11.2012,0.2007),(11.3112,0.2207),(11.2712,0.2807)]),
+              box(11.1012,0.0807,11.1612,0.1507),     # overlaps the first
+              box(11.3312,0.0107,11.3612,0.0407),
+              box(11.3322,0.2107,11.3392,0.2147)]     # second shape of plot C
+    return gpd.GeoDataFrame({'layer':['A','B','C','D','C']},geometry=shapes,crs='EPSG:4326')
+
+def test_plot_stats_match_rio_clip():
+    array = grid_map().rio.set_spatial_dims(x_dim='lon',y_dim='lat').rio.write_crs('EPSG:4326')
+    shapes = plots()
+    for all_touched in (False,True):
+        stats = plot_stats(array,plot_index(shapes,array.lat,array.lon,all_touched))
+        for name in ['A','B','C','D']:
+            clipped = array.rio.clip(shapes[shapes.layer == name].geometry,shapes.crs,all_touched=all_touched)
+            assert stats['count'][name] == int(clipped.count())
+            np.testing.assert_allclose(stats['mean'][name],float(clipped.mean()),rtol=1e-12)
+            np.testing.assert_allclose(stats['std'][name],float(clipped.std()),rtol=1e-12)
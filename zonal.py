@@ -0,0 +1,147 @@
+"""
+Author : Harry Carstairs
+
+Per-plot (zonal) statistics of maps on a regular lat/lon grid
+
+Instead of clipping a map to each plot in turn (ds.rio.clip), the plots are rasterised once per grid
+into an index of the pixels each plot covers. The statistics of every plot are then found together,
+with one bincount per map:
+
+    index = plot_index(shps, ds.lat, ds.lon, all_touched=True)
+    stats = plot_stats(changeMap, index)    # mean, std and count of each plot
+    stats['mean']['GC1']
+
+The pixels are those rio.clip would keep (same all_touched rule), and NaNs are ignored as in .mean().
+Only the window around each plot is rasterised, so a pixel centre lying exactly on the edge of a plot
+can fall the other way from rio.clip (which rasterises the whole grid).
+Plots may overlap - a pixel touched by two plots counts towards both.
+
+"""
+
+
+import numpy as np
+import pandas as pd
+from rasterio import features
+from rasterio.transform import Affine
+
+# Indexes already made, by plots and grid
+INDEXES = {}
+
+def grid_transform(lat,lon):
+    """
+    Affine transform of a regular grid, from the coordinates of the pixel centres
+    (as rioxarray works it out)
+    """
+    dlat = (lat[-1] - lat[0])/(len(lat) - 1)
+    dlon = (lon[-1] - lon[0])/(len(lon) - 1)
+    return Affine(dlon, 0, lon[0] - dlon/2, 0, dlat, lat[0] - dlat/2)
+
+def shape_window(coord,a,b,step):
+    # Index slice of the pixels of one axis that could overlap the interval [a, b]
+    lo, hi = min(a,b) - abs(step), max(a,b) + abs(step)
+    inside = np.nonzero((coord >= lo) & (coord <= hi))[0]
+    if len(inside) == 0:
+        return None
+    return slice(int(inside[0]),int(inside[-1])+1)
+
+def rasterise(geometry,lat,lon,all_touched=False):
+    """
+    Flat indices (into a lat x lon array) of the pixels covered by one geometry
+    Only the window around the geometry is rasterised
+    """
+    lon1, lat1, lon2, lat2 = geometry.bounds
+    rows = shape_window(lat,lat1,lat2,lat[1]-lat[0])
+    cols = shape_window(lon,lon1,lon2,lon[1]-lon[0])
+    if rows is None or cols is None:
+        return np.zeros(0,dtype=np.int64)
+    # The transform of the whole grid, moved to the corner of the window
+    transform = grid_transform(lat,lon)*Affine.translation(cols.start,rows.start)
+    window = features.rasterize([(geometry,1)],
+                                out_shape=(rows.stop-rows.start,cols.stop-cols.start),
+                                transform=transform,
+                                fill=0, all_touched=all_touched, dtype='uint8')
+    i, j = np.nonzero(window)
+    return (i + rows.start)*len(lon) + (j + cols.start)
+
+def plot_index(shapes,lat,lon,all_touched=False,name='layer'):
+    """
+    Rasterises every plot onto the grid, once
+
+    Parameters
+    ----------
+    shapes : GeoDataFrame
+        plot geometries (in lat/lon, as used with rio.clip)
+    lat, lon : 1D arrays or DataArrays
+        pixel centres of the grid
+    all_touched : bool
+        include pixels that partially intersect a plot
+    name : str
+        column of shapes that names the plots (e.g. 'GC1'); plots made of several shapes are merged
+
+    Returns
+    -------
+    index : dict
+        names : plot names, in the order of the labels
+        pixels : flat pixel indices, for all plots
+        labels : plot number of each entry of pixels
+        shape : (len(lat), len(lon))
+    """
+    lat, lon = np.asarray(lat), np.asarray(lon)
+    if shapes.crs is not None:
+        shapes = shapes.to_crs('EPSG:4326')
+    key = (tuple(shapes[name]),tuple(g.wkb for g in shapes.geometry),
+           lat.tobytes(),lon.tobytes(),all_touched)
+    if key in INDEXES:
+        return INDEXES[key]
+    names = list(pd.unique(shapes[name]))
+    pixels, labels = [], []
+    for k, plot in enumerate(names):
+        covered = np.unique(np.concatenate([rasterise(g,lat,lon,all_touched)
+                                            for g in shapes[shapes[name] == plot].geometry]))
+        pixels.append(covered)
+        labels.append(np.full(len(covered),k))
+    index = {'names':names,
+             'pixels':np.concatenate(pixels).astype(np.int64),
+             'labels':np.concatenate(labels).astype(np.int64),
+             'shape':(len(lat),len(lon))}
+    INDEXES[key] = index
+    return index
+
+def plot_stats(values,index):
+    """
+    Mean, standard deviation (ddof=0) and count of valid pixels of each plot
+
+    Parameters
+    ----------
+    values : (..., lat, lon) array or DataArray on the grid of index
+        leading dimensions (e.g. t or looks) are kept - each gets its own statistics
+    index : dict from plot_index
+
+    Returns
+    -------
+    stats : DataFrame indexed by plot name, with columns mean, std and count
+        (for more than 2 dimensions, a dict of arrays (..., plots) instead)
+    """
+    values = np.asarray(values,dtype=np.float64)
+    if values.shape[-2:] != index['shape']:
+        raise ValueError('values are not on the grid of the index')
+    lead = values.shape[:-2]
+    n = len(index['names'])
+    samples = values.reshape((-1,values.shape[-2]*values.shape[-1]))[:,index['pixels']]
+    # One bincount for every plot and leading index: label k of row r becomes r*n + k
+    labels = (np.arange(samples.shape[0])[:,None]*n + index['labels']).ravel()
+    samples = samples.ravel()
+    valid = ~np.isnan(samples)
+    size = n*int(np.prod(lead,dtype=np.int64))
+    count = np.bincount(labels[valid],minlength=size)
+    total = np.bincount(labels[valid],weights=samples[valid],minlength=size)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean = total/count
+        square = np.bincount(labels[valid],weights=(samples[valid]-mean[labels[valid]])**2,minlength=size)
+        std = np.sqrt(square/count)
+    stats = {'mean':mean.reshape(lead+(n,)),
+             'std':std.reshape(lead+(n,)),
+             'count':count.reshape(lead+(n,))}
+    if len(lead) == 0:
+        return pd.DataFrame(stats,index=index['names'])
+    return stats